@@ -1,36 +1,101 @@
 print("Program starting...")
-print("Please be patient, it takes around 20 seconds to initialise this program for the first time.")
-%pip install beanie bcrypt traitlets --q
 
-import nest_asyncio
-import asyncio
-import inspect
+import time
+from contextlib import contextmanager, suppress, ExitStack
+
+class StartupTimer:
+    '''
+    Records how long each step of the start-up takes. `report()` lists the steps in the order they started,
+    the steps run concurrently with each other overlap. It is printed when the app has started if `WA3_STARTUP_REPORT` is set.
+    '''
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.spans = [] # (name, start, duration) in seconds since the program started
 
-loop = asyncio.get_event_loop()
-nest_asyncio.apply()
+    @contextmanager
+    def span(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.spans.append((name, start - self.origin, time.perf_counter() - start))
+
+    def report(self):
+        lines = [f"{'step':<28}{'start (s)':>10}{'duration (s)':>14}"]
+        for name, start, duration in sorted(self.spans, key=lambda x: x[1]):
+            lines.append(f"{name:<28}{start:>10.3f}{duration:>14.3f}")
+        return "\n".join(lines)
+
+startupTimer = StartupTimer()
+
+with startupTimer.span("imports"):
+    import argparse
+    import contextvars
+    import hashlib
+    import hmac
+    import importlib
+    import importlib.util
+    import json
+    import math
+    import os
+    import re
+    import subprocess
+    import sys
+    import threading
+    import traceback
 
-from traitlets import HasTraits, dlink, Unicode, Instance
-import types
+    '''
+    The dependencies are declared in requirements.txt instead of being installed every time the program starts.
+    '''
+    REQUIRED_MODULES = ["beanie", "bcrypt", "ipywidgets", "motor", "nest_asyncio", "numpy", "pydantic", "pymongo", "traitlets"]
+    missing_modules = [name for name in REQUIRED_MODULES if importlib.util.find_spec(name) is None]
+    if missing_modules:
+        raise ModuleNotFoundError(f"Missing {', '.join(missing_modules)}. Install the dependencies in requirements.txt first, e.g. `%pip install -r requirements.txt`.")
 
-from abc import ABC, abstractmethod
+    import nest_asyncio
+    import asyncio
+    import inspect
 
-import ipywidgets as widgets
-from IPython.display import clear_output, display
+    loop = asyncio.get_event_loop()
+    nest_asyncio.apply()
 
-import time
-from google.colab import userdata
+    from traitlets import HasTraits, dlink, Unicode, Instance
+    import types
+
+    from abc import ABC, abstractmethod
 
-from pydantic import BaseModel, Field, model_validator
-from typing import Optional
-from beanie import init_beanie, Document, Indexed
-from motor.motor_asyncio import AsyncIOMotorClient
-from pymongo.errors import DuplicateKeyError
+    import ipywidgets as widgets
+    from IPython.display import clear_output, display
 
-from datetime import datetime
+    from pydantic import BaseModel, Field, model_validator
+    from typing import Optional
+    from beanie import init_beanie, Document, Indexed, PydanticObjectId # The data models subclass `Document`, so that beanie cannot be imported lazily
+    from pymongo import ASCENDING, IndexModel, ReadPreference, ReturnDocument, UpdateOne
+    from pymongo.monitoring import CommandListener, ConnectionPoolListener
+    from pymongo.errors import BulkWriteError, DuplicateKeyError, PyMongoError
 
-import random
+    from datetime import datetime
 
-import bcrypt
+    import bson
+
+    import random
+    import secrets
+    from functools import lru_cache
+    from array import array
+    from collections import OrderedDict
+    from fractions import Fraction
+
+    from concurrent.futures import ThreadPoolExecutor
+
+def lazy_import(name):
+    '''
+    Imports a module the first time it is needed instead of when the program starts, e.g. `lazy_import("bcrypt")`.
+    '''
+    module = sys.modules.get(name)
+    if module is None:
+        with startupTimer.span(f"import {name}"):
+            module = importlib.import_module(name)
+    return module
 
 ############################## Data Models ##############################
 
@@ -43,12 +108,20 @@ class UserModel(Document):
         collection = "UserModel"
 
 class QuestionModel(Document):
-    question: Indexed(str, unique=True)
+    question: str
     solution: str
     answer: str
     title: str
+    keyIndex: Optional[int] = None # The index of the parameters in the key space of the question generator
+    fingerprint: Optional[int] = None # 64-bit hash of the title and the normalized parameters, see `question_fingerprint`
+    canonicalAnswer: Optional[str] = None # See `canonical_answer`
     class Settings:
         collection = "QuestionsBank"
+        indexes = [
+            IndexModel([("title", ASCENDING), ("keyIndex", ASCENDING)]), # Serves the queries by title, and the key indices of a title without reading the documents
+            # The questions saved before the fingerprint have none, so that they are left out of the unique index
+            IndexModel([("fingerprint", ASCENDING)], unique=True, partialFilterExpression={"fingerprint": {"$type": "number"}})
+        ]
 
 class AttemptModel(Document):
     userId: str
@@ -62,70 +135,1333 @@ class AttemptModel(Document):
     timesOfAnswering: int = 1
     class Settings:
         collection = "AttemptModel"
+        indexes = [
+            IndexModel([("userId", ASCENDING), ("questionId", ASCENDING)], unique=True), # One attempt per user per question, which the upserts rely on
+            IndexModel([("userId", ASCENDING), ("timeStamp", ASCENDING)]) # The history of a user by time
+        ]
+
+class TitleProgress(BaseModel):
+    attempted: int = 0 # Number of questions of the title the user has submitted
+    correct: int = 0 # Number of those questions answered correctly
+    answers: int = 0 # Sum of `timesOfAnswering` over those questions
+
+    @property
+    def averageTimesOfAnswering(self):
+        return self.answers / self.attempted if self.attempted else 0.0
+
+class ProgressModel(Document):
+    '''
+    The counters of one user, kept up to date on every submission, so that the dashboard does not have to scan the attempts.
+    They can be recomputed from the attempts with `ProgressRepository.rebuild`.
+    '''
+    userId: Indexed(str, unique=True)
+    titles: dict[str, TitleProgress] = Field(default_factory=dict)
+    class Settings:
+        collection = "UserProgress"
+
+DOCUMENT_MODELS = [UserModel, QuestionModel, AttemptModel, ProgressModel]
 
 class Quiz(BaseModel):
     question: str
     answer: str
     solution: str
+    keyIndex: Optional[int] = None
+    fingerprint: Optional[int] = None
+    canonicalAnswer: Optional[str] = None
+
+    @model_validator(mode="after")
+    def fill_canonical_answer(self):
+        '''
+        The canonical answer is computed once when the quiz is made or loaded, so that checking a submission never parses the stored answer again.
+        '''
+        if self.canonicalAnswer is None:
+            self.canonicalAnswer = canonical_answer(self.answer)
+        return self
+
+class User(BaseModel):
+    id: str
+    name: str
+    username: str
+    hashedPassword: str
 ############################## End of Data Models ##############################
 
+############################## Storage ##############################
+'''
+Everything the app reads from or writes to the database goes through the repositories of a storage backend,
+so that the app runs the same on MongoDB and entirely in memory.
+The repositories take and return `User` and `Quiz` instead of the beanie documents, which only exist once beanie is initialised.
+The backend in use is `storage`, which is chosen at the entry point.
+'''
+
+def duplicate_key_error(collection, key):
+    return DuplicateKeyError(f"E11000 duplicate key error collection: {collection} dup key: {key}", 11000)
+
+class UserRepository(ABC):
+    @abstractmethod
+    async def insert(self, *, name, username, hashedPassword) -> str:
+        '''
+        Returns the id of the new user, or raises `DuplicateKeyError` if the username is chosen.
+        '''
+        pass
+
+    @abstractmethod
+    async def find_by_username(self, username) -> Optional[User]:
+        pass
+
+class QuestionRepository(ABC):
+    @abstractmethod
+    async def insert(self, title, quiz_obj) -> str:
+        '''
+        Returns the id of the new question, or raises `DuplicateKeyError` if the question is already in the bank.
+        '''
+        pass
+
+    @abstractmethod
+    async def insert_many(self, title, quiz_objs) -> list:
+        '''
+        Inserts the questions without stopping at a duplicate.
+        Returns the id of each question in the same order, or None for a question that is already in the bank.
+        '''
+        pass
+
+    @abstractmethod
+    async def count(self, title) -> int:
+        '''
+        Counts the questions of the title which `sample` may return.
+        '''
+        pass
+
+    @abstractmethod
+    async def sample(self, title, size) -> list:
+        '''
+        Returns up to `size` random (Quiz, question id) pairs of the title.
+        Only the questions made by a `QuestionGenerator`, which have a `keyIndex`, are sampled,
+        so that the placeholder questions saved before the generators are never served.
+        '''
+        pass
+
+    @abstractmethod
+    async def key_indices(self, title) -> list:
+        pass
+
+    @abstractmethod
+    def export(self, *, title = None, after = None, batchSize = 1000):
+        '''
+        An async generator of (question id, title, Quiz) in the order of the ids, starting after the id `after`,
+        so that an interrupted export can carry on from the last exported id.
+        '''
+        pass
+
+    @abstractmethod
+    async def insert_exported(self, records) -> int:
+        '''
+        Inserts (question id, title, Quiz) records with their own ids, skipping the records already in the bank.
+        Returns the number of inserted records.
+        '''
+        pass
+
+class AttemptRepository(ABC):
+    '''
+    Keeps one attempt per user per question, and a submission only changes `timesOfAnswering` and `isCorrect` of the attempt.
+    A submission only counts until the question is answered correctly, so that it changes nothing once the attempt is correct.
+    The outcome of a submission is `(isNew, isNewlyCorrect, isCounted)`: whether it created the attempt, whether it turned the attempt correct,
+    and whether it was counted, i.e. the attempt was not correct before.
+    '''
+    @abstractmethod
+    async def record_submission(self, *, userId, questionId, isCorrect, timesOfAnswering = 1, timeStamp = None):
+        '''
+        Returns the outcome of the submission.
+        '''
+        pass
+
+    @abstractmethod
+    async def record_submissions(self, submissions):
+        '''
+        `submissions` maps (userId, questionId) to the `isCorrect`, `timesOfAnswering` and `timeStamp` of the attempt.
+        Returns a dict which maps the same keys to their outcomes.
+        '''
+        pass
+
+class ProgressRepository(ABC):
+    '''
+    Keeps a `TitleProgress` per user per title.
+    '''
+    @abstractmethod
+    async def add(self, changes):
+        '''
+        `changes` maps (userId, title) to the increments of `attempted`, `correct` and `answers`.
+        '''
+        pass
+
+    @abstractmethod
+    async def get(self, userId) -> dict:
+        '''
+        Returns a dict which maps every title the user has attempted to its `TitleProgress`.
+        '''
+        pass
+
+    @abstractmethod
+    async def rebuild(self, userId = None):
+        '''
+        Recomputes the counters of one user, or of every user, from the attempts.
+        '''
+        pass
+
+def group_by_user(changes):
+    users = dict() # key: userId, value: dict of title to increments
+    for (userId, title), counters in changes.items():
+        users.setdefault(userId, dict())[title] = counters
+    return users
+
+class StorageBackend(ABC):
+    users: UserRepository
+    questions: QuestionRepository
+    attempts: AttemptRepository
+    progress: ProgressRepository
+
+    async def connect(self):
+        pass
+
+    async def close(self):
+        pass
+
+def duplicate_key_indices(error):
+    '''
+    The indices of the operations of an unordered bulk write which failed on a duplicate key. Any other write error is raised again.
+    '''
+    write_errors = error.details.get("writeErrors", [])
+    if any(write_error["code"] != 11000 for write_error in write_errors):
+        raise error
+    return [write_error["index"] for write_error in write_errors]
+
+class MongoUserRepository(UserRepository):
+    async def insert(self, *, name, username, hashedPassword):
+        user = UserModel(name=name, username=username, hashedPassword=hashedPassword)
+        await user.insert()
+        return str(user.id)
+
+    @staticmethod
+    def by_username(username):
+        return {"username": username}
+
+    @classmethod
+    def queries(cls):
+        '''
+        The commands of this repository with sample values, built by the same helpers as the repository, see `repository_queries`.
+        '''
+        return [("find user by username", {"find": UserModel.Settings.collection, "filter": cls.by_username("username")})]
+
+    async def find_by_username(self, username):
+        user = await UserModel.find_one(self.by_username(username))
+        if user is None:
+            return None
+        return User(id=str(user.id), name=user.name, username=user.username, hashedPassword=user.hashedPassword)
+
+class MongoQuestionRepository(QuestionRepository):
+    '''
+    The questions are read with `readPreference`, so that the reads can be served by the secondaries.
+    A question read from a lagging secondary is still safe, as the unique index of the primary catches the collisions.
+    '''
+    def __init__(self, readPreference = ReadPreference.PRIMARY):
+        self.readPreference = readPreference
+
+    def reads(self):
+        return QuestionModel.get_motor_collection().with_options(read_preference=self.readPreference)
+
+    @staticmethod
+    def to_model(title, quiz_obj):
+        return QuestionModel(
+            id = PydanticObjectId(), # The id is assigned before inserting so that `insert_many` does not have to return it
+            question = quiz_obj.question,
+            solution = quiz_obj.solution,
+            answer = quiz_obj.answer,
+            title = title,
+            keyIndex = quiz_obj.keyIndex,
+            fingerprint = quiz_fingerprint(title, quiz_obj),
+            canonicalAnswer = quiz_obj.canonicalAnswer
+            )
+
+    async def insert(self, title, quiz_obj):
+        question_model = self.to_model(title, quiz_obj)
+        await question_model.insert()
+        return str(question_model.id)
+
+    async def insert_many(self, title, quiz_objs):
+        question_models = [self.to_model(title, quiz_obj) for quiz_obj in quiz_objs]
+        collided = set()
+        try:
+            await QuestionModel.insert_many(question_models, ordered=False)
+        except BulkWriteError as e:
+            collided = set(duplicate_key_indices(e))
+        return [None if index in collided else str(question_model.id) for index, question_model in enumerate(question_models)]
+
+    EXPORT_PROJECTION = {"_id": 1, "title": 1, "question": 1, "solution": 1, "answer": 1, "keyIndex": 1, "fingerprint": 1, "canonicalAnswer": 1}
+
+    @staticmethod
+    def servable(title):
+        '''
+        The query of the questions of a title which can be sampled, served by the index on title and keyIndex.
+        '''
+        return {"title": title, "keyIndex": {"$type": "number"}}
+
+    @classmethod
+    def sample_pipeline(cls, title, size):
+        return [
+            {"$match": cls.servable(title)},
+            {"$sample": {"size": size}}
+        ]
+
+    @staticmethod
+    def key_indices_query(title):
+        return {"title": title, "keyIndex": {"$ne": None}}
+
+    @staticmethod
+    def export_query(title, after):
+        query = dict()
+        if title is not None:
+            query["title"] = title
+        if after is not None:
+            query["_id"] = {"$gt": PydanticObjectId(after)}
+        return query
+
+    @classmethod
+    def queries(cls):
+        questions = QuestionModel.Settings.collection
+        return [
+            # The pipeline that `count_documents` sends
+            ("count questions of title", {"aggregate": questions, "pipeline": [{"$match": cls.servable("title")}, {"$group": {"_id": 1, "n": {"$sum": 1}}}], "cursor": {}}),
+            ("sample questions of title", {"aggregate": questions, "pipeline": cls.sample_pipeline("title", 5), "cursor": {}}),
+            ("key indices of title", {"distinct": questions, "key": "keyIndex", "query": cls.key_indices_query("title")}),
+            ("export questions", {"find": questions, "filter": cls.export_query(None, str(PydanticObjectId())), "projection": cls.EXPORT_PROJECTION, "sort": {"_id": 1}}),
+            ("export questions of title", {"find": questions, "filter": cls.export_query("title", str(PydanticObjectId())), "projection": cls.EXPORT_PROJECTION, "sort": {"_id": 1}}),
+        ]
+
+    async def count(self, title):
+        return await self.reads().count_documents(self.servable(title))
+
+    async def sample(self, title, size):
+        documents = await self.reads().aggregate(self.sample_pipeline(title, size)).to_list(None)
+
+        return [(Quiz(
+                    question = document["question"],
+                    solution = document["solution"],
+                    answer = document["answer"],
+                    keyIndex = document.get("keyIndex"),
+                    fingerprint = document.get("fingerprint"),
+                    canonicalAnswer = document.get("canonicalAnswer")
+                    ), str(document["_id"]))
+                for document in documents]
+
+    async def key_indices(self, title):
+        return await self.reads().distinct("keyIndex", self.key_indices_query(title))
+
+    async def export(self, *, title = None, after = None, batchSize = 1000):
+        cursor = self.reads().find(self.export_query(title, after), self.EXPORT_PROJECTION).sort("_id", ASCENDING).batch_size(batchSize)
+        async for document in cursor:
+            yield str(document["_id"]), document["title"], Quiz(
+                question = document["question"],
+                solution = document["solution"],
+                answer = document["answer"],
+                keyIndex = document.get("keyIndex"),
+                fingerprint = document.get("fingerprint"),
+                canonicalAnswer = document.get("canonicalAnswer")
+            )
+
+    async def insert_exported(self, records):
+        question_models = []
+        for questionid, title, quiz_obj in records:
+            question_model = self.to_model(title, quiz_obj)
+            question_model.id = PydanticObjectId(questionid)
+            question_models.append(question_model)
+        if not question_models:
+            return 0
+
+        try:
+            await QuestionModel.insert_many(question_models, ordered=False)
+        except BulkWriteError as e:
+            return len(question_models) - len(duplicate_key_indices(e))
+        return len(question_models)
+
+class MongoAttemptRepository(AttemptRepository):
+    '''
+    Writes the attempts with targeted updates keyed by (userId, questionId) instead of saving the whole document,
+    so that only the changed fields are sent and two clients submitting the same attempt cannot overwrite each other.
+    '''
+    @staticmethod
+    def submission_update(*, userId, questionId, isCorrect, timesOfAnswering = 1, timeStamp = None):
+        '''
+        Only matches an attempt which is not correct yet. For a correct one, the upsert fails on the unique index instead, and nothing is changed.
+        '''
+        return (
+            {"userId": userId, "questionId": questionId, "isCorrect": False},
+            {
+                "$inc": {"timesOfAnswering": timesOfAnswering},
+                "$set": {"isCorrect": isCorrect},
+                "$setOnInsert": {"timeStamp": timeStamp if timeStamp is not None else datetime.now()}
+            }
+        )
+
+    @staticmethod
+    def before_query(keys):
+        return {"$or": [{"userId": userId, "questionId": questionId} for userId, questionId in keys]}
+
+    @classmethod
+    def queries(cls):
+        attempts = AttemptModel.Settings.collection
+        userId, questionId = str(PydanticObjectId()), str(PydanticObjectId())
+        query, update = cls.submission_update(userId = userId, questionId = questionId, isCorrect = False)
+        return [
+            ("upsert attempt", {"findAndModify": attempts, "query": query, "update": update, "upsert": True, "fields": {"isCorrect": 1}}),
+            ("find attempts before flush", {"find": attempts, "filter": cls.before_query([(userId, questionId)]), "projection": {"_id": 0, "userId": 1, "questionId": 1, "isCorrect": 1}}),
+            ("upsert attempts of flush", {"update": attempts, "updates": [{"q": query, "u": update, "upsert": True}]}),
+        ]
+
+    async def record_submission(self, *, userId, questionId, isCorrect, timesOfAnswering = 1, timeStamp = None):
+        '''
+        When two upserts of a new attempt race, one of them hits the unique index, and it is retried as an update of the other.
+        When the retry hits the unique index again, the attempt is already correct.
+        '''
+        query, update = self.submission_update(
+            userId = userId,
+            questionId = questionId,
+            isCorrect = isCorrect,
+            timesOfAnswering = timesOfAnswering,
+            timeStamp = timeStamp
+        )
+        collection = AttemptModel.get_motor_collection()
+        try:
+            before = await collection.find_one_and_update(query, update, upsert=True, projection={"isCorrect": 1}, return_document=ReturnDocument.BEFORE)
+        except DuplicateKeyError:
+            try:
+                before = await collection.find_one_and_update(query, update, upsert=True, projection={"isCorrect": 1}, return_document=ReturnDocument.BEFORE)
+            except DuplicateKeyError:
+                return (False, False, False)
+        return (before is None, isCorrect, True)
+
+    async def record_submissions(self, submissions):
+        '''
+        The outcomes come from reading the attempts before the bulk write, in one query served by the unique index.
+        The upserts of the attempts which are already correct fail on the unique index on the retry, and are left as they are.
+        '''
+        if not submissions:
+            return dict()
+
+        collection = AttemptModel.get_motor_collection()
+        cursor = collection.find(
+            self.before_query(submissions),
+            {"_id": 0, "userId": 1, "questionId": 1, "isCorrect": 1}
+        )
+        before = {(document["userId"], document["questionId"]): document["isCorrect"] async for document in cursor}
+
+        operations = [
+            UpdateOne(*self.submission_update(userId = userId, questionId = questionId, **changes), upsert=True)
+            for (userId, questionId), changes in submissions.items()
+        ]
+        try:
+            await AttemptModel.get_motor_collection().bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            retry = [operations[index] for index in duplicate_key_indices(e)]
+            try:
+                await AttemptModel.get_motor_collection().bulk_write(retry, ordered=False)
+            except BulkWriteError as e:
+                duplicate_key_indices(e) # Only the upserts of the correct attempts fail again, see `submission_update`
+
+        return {
+            key: (key not in before, changes["isCorrect"] and not before.get(key, False), not before.get(key, False))
+            for key, changes in submissions.items()
+        }
+
+class MongoProgressRepository(ProgressRepository):
+    @staticmethod
+    def of_user(userId):
+        return {"userId": userId}
+
+    @staticmethod
+    def increments(titles):
+        return {"$inc": {f"titles.{title}.{name}": value for title, counters in titles.items() for name, value in counters.items()}}
+
+    @staticmethod
+    def rebuild_pipeline(userId = None):
+        pipeline = [] if userId is None else [{"$match": {"userId": userId}}]
+        pipeline += [
+            {"$addFields": {"questionObjectId": {"$toObjectId": "$questionId"}}},
+            {"$lookup": {"from": QuestionModel.Settings.collection, "localField": "questionObjectId", "foreignField": "_id", "as": "question"}},
+            {"$unwind": "$question"},
+            {"$group": {
+                "_id": {"userId": "$userId", "title": "$question.title"},
+                "attempted": {"$sum": 1},
+                "correct": {"$sum": {"$cond": ["$isCorrect", 1, 0]}},
+                "answers": {"$sum": "$timesOfAnswering"},
+            }},
+            {"$group": {
+                "_id": "$_id.userId",
+                "titles": {"$push": {"k": "$_id.title", "v": {"attempted": "$attempted", "correct": "$correct", "answers": "$answers"}}},
+            }},
+            {"$project": {"_id": 0, "userId": "$_id", "titles": {"$arrayToObject": "$titles"}}},
+            {"$merge": {"into": ProgressModel.Settings.collection, "on": "userId", "whenMatched": "replace", "whenNotMatched": "insert"}},
+        ]
+        return pipeline
+
+    @classmethod
+    def queries(cls):
+        progress = ProgressModel.Settings.collection
+        userId = str(PydanticObjectId())
+        return [
+            ("progress of user", {"find": progress, "filter": cls.of_user(userId), "projection": {"_id": 0, "titles": 1}}),
+            ("upsert progress", {"update": progress, "updates": [{"q": cls.of_user(userId), "u": cls.increments({"title": {"attempted": 1}}), "upsert": True}]}),
+            # With its `$lookup` of the questions by id and its `$merge` into the progress by userId
+            ("rebuild progress of user", {"aggregate": AttemptModel.Settings.collection, "pipeline": cls.rebuild_pipeline(userId), "cursor": {}}),
+        ]
+
+    async def add(self, changes):
+        '''
+        Every user is one `$inc` upsert, and the counters of a title are at `titles.<title>`, so that a title must not contain a dot.
+        '''
+        if not changes:
+            return
+
+        operations = [
+            UpdateOne(self.of_user(userId), self.increments(titles), upsert=True)
+            for userId, titles in group_by_user(changes).items()
+        ]
+        try:
+            await ProgressModel.get_motor_collection().bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            retry = [operations[index] for index in duplicate_key_indices(e)]
+            await ProgressModel.get_motor_collection().bulk_write(retry, ordered=False)
+
+    async def get(self, userId):
+        document = await ProgressModel.get_motor_collection().find_one(self.of_user(userId), {"_id": 0, "titles": 1})
+        if document is None:
+            return dict()
+        return {title: TitleProgress(**counters) for title, counters in document.get("titles", {}).items()}
+
+    async def rebuild(self, userId = None):
+        '''
+        Groups the attempts by user and title on the server, and `$merge`s the result over the counters.
+        The title is looked up from the question, as the attempts do not store it.
+        '''
+        await AttemptModel.get_motor_collection().aggregate(self.rebuild_pipeline(userId)).to_list(None)
+
+class CollectionScanError(Exception):
+    def __init__(self, message, plans):
+        super().__init__(message)
+        self.plans = plans
+
+def repository_queries():
+    '''
+    The commands the repositories send, with sample values, so that their query plans can be checked.
+    Every repository builds them with the same helpers as its own queries, so that the check follows the queries when they change.
+    '''
+    return [query for repository in [MongoUserRepository, MongoQuestionRepository, MongoAttemptRepository, MongoProgressRepository] for query in repository.queries()]
+
+def winning_stages(explain):
+    '''
+    Collects the stage names of every winning plan in an explain output, which nests them differently for find, update, distinct and aggregate.
+    '''
+    stages = []
+    def collect(node, isWinning):
+        if isinstance(node, dict):
+            if isWinning and "stage" in node:
+                stages.append(node["stage"])
+            for key, value in node.items():
+                if key != "rejectedPlans":
+                    collect(value, isWinning or key == "winningPlan")
+        elif isinstance(node, list):
+            for value in node:
+                collect(value, isWinning)
+    collect(explain, False)
+    return stages
+
+class PoolStatistics(ConnectionPoolListener):
+    '''
+    Listens to the connection pool of the client, to size `maxPoolSize` for the bursts of a whole class logging in at once.
+    A checkout that waits for a free connection shows up in `maxWaitSeconds`, and `maxCheckedOut` close to `maxPoolSize` means the pool is too small.
+    '''
+    def __init__(self):
+        self.checkedOut = 0
+        self.maxCheckedOut = 0
+        self.checkOuts = 0
+        self.checkOutFailures = 0
+        self.totalWaitSeconds = 0.0
+        self.maxWaitSeconds = 0.0
+        self.connections = 0
+        self.poolClears = 0
+
+    def connection_checked_out(self, event):
+        self.checkedOut += 1
+        self.maxCheckedOut = max(self.maxCheckedOut, self.checkedOut)
+        self.checkOuts += 1
+        duration = getattr(event, "duration", None) # Since pymongo 4.7, an older one already installed in the notebook has none
+        if duration is not None:
+            self.totalWaitSeconds += duration
+            self.maxWaitSeconds = max(self.maxWaitSeconds, duration)
+
+    def connection_checked_in(self, event):
+        self.checkedOut -= 1
+
+    def connection_check_out_failed(self, event):
+        self.checkOutFailures += 1
+
+    def connection_created(self, event):
+        self.connections += 1
+
+    def connection_closed(self, event):
+        self.connections -= 1
+
+    def pool_cleared(self, event):
+        self.poolClears += 1
+
+    def connection_check_out_started(self, event): pass
+    def connection_ready(self, event): pass
+    def pool_created(self, event): pass
+    def pool_ready(self, event): pass
+    def pool_closed(self, event): pass
+
+    def snapshot(self):
+        return {
+            "checkedOut": self.checkedOut,
+            "maxCheckedOut": self.maxCheckedOut,
+            "checkOuts": self.checkOuts,
+            "checkOutFailures": self.checkOutFailures,
+            "meanWaitMs": 1000 * self.totalWaitSeconds / self.checkOuts if self.checkOuts else 0.0,
+            "maxWaitMs": 1000 * self.maxWaitSeconds,
+            "connections": self.connections,
+            "poolClears": self.poolClears,
+        }
+
+class CommandCounter(CommandListener):
+    '''
+    Counts every command sent to the server as a database command of the current span, e.g. the `find` and the `bulk_write` of one flush,
+    or the retry after a duplicate key. Motor runs the commands on its threads with a copy of the context of the caller,
+    so that the span of the awaiting handler is the current one.
+    '''
+    def started(self, event):
+        tracer.count("dbCommands")
+
+    def succeeded(self, event): pass
+    def failed(self, event): pass
+
+def available_compressors():
+    '''
+    zstd and snappy are only offered when their optional packages are installed, and zlib is always available.
+    '''
+    compressors = []
+    if importlib.util.find_spec("zstandard") is not None:
+        compressors.append("zstd")
+    if importlib.util.find_spec("snappy") is not None:
+        compressors.append("snappy")
+    compressors.append("zlib")
+    return compressors
+
+class MongoStorage(StorageBackend):
+    '''
+    Owns the client of the database: its pool and timeouts, the compression of the wire protocol, and a background health check.
+    After `maxFailedPings` failed pings in a row, the client is replaced by a new one.
+    '''
+    def __init__(self, connectionString = None, *, maxPoolSize = 50, minPoolSize = 5, maxIdleTimeMS = 60_000, waitQueueTimeoutMS = 10_000,
+                 serverSelectionTimeoutMS = 10_000, connectTimeoutMS = 10_000, socketTimeoutMS = 20_000, compressors = None,
+                 questionReadPreference = ReadPreference.SECONDARY_PREFERRED, healthCheckInterval = 30.0, maxFailedPings = 3):
+        self.connectionString = connectionString
+        self.options = {
+            "maxPoolSize": maxPoolSize,
+            "minPoolSize": minPoolSize,
+            "maxIdleTimeMS": maxIdleTimeMS,
+            "waitQueueTimeoutMS": waitQueueTimeoutMS,
+            "serverSelectionTimeoutMS": serverSelectionTimeoutMS,
+            "connectTimeoutMS": connectTimeoutMS,
+            "socketTimeoutMS": socketTimeoutMS,
+            "compressors": ",".join(compressors if compressors is not None else available_compressors()),
+            "appname": "WA3",
+        }
+        self.healthCheckInterval = healthCheckInterval
+        self.maxFailedPings = maxFailedPings
+        self.client = None
+        self.healthCheck = None
+        self.isHealthy = False
+        self.poolStatistics = PoolStatistics()
+        self.commandCounter = CommandCounter()
+        self.users = MongoUserRepository()
+        self.questions = MongoQuestionRepository(readPreference=questionReadPreference)
+        self.attempts = MongoAttemptRepository()
+        self.progress = MongoProgressRepository()
+
+    async def open(self):
+        motor_asyncio = lazy_import("motor.motor_asyncio")
+        with startupTimer.span("create client"):
+            # Create a new client and connect to the server
+            self.client = motor_asyncio.AsyncIOMotorClient(
+                self.connectionString or get_connection_string(),
+                event_listeners=[self.poolStatistics, self.commandCounter],
+                **self.options
+            )
+
+        with startupTimer.span("init_beanie"):
+            await init_beanie(database=self.client["WA3"], document_models=DOCUMENT_MODELS)
+
+    async def connect(self):
+        await self.open()
+
+        with startupTimer.span("ping"):
+            await self.client.admin.command('ping')
+        self.isHealthy = True
+
+        with startupTimer.span("ensure indexes"):
+            await self.ensure_indexes()
+
+        if self.healthCheckInterval is not None:
+            self.healthCheck = contextvars.Context().run(asyncio.ensure_future, self.check_health())
+
+    obsoleteIndexes = {QuestionModel: ["question_1"]} # The unique index of the whole question text was replaced by the fingerprint
+
+    async def ensure_indexes(self):
+        '''
+        Creates the indexes declared in the `Settings` of the models which are missing from the database, e.g. after a collection was restored without them,
+        and drops the obsolete ones. Returns the names of the created indexes.
+        '''
+        async def ensure(model):
+            collection = model.get_motor_collection()
+            information = await collection.index_information()
+            for name in self.obsoleteIndexes.get(model, []):
+                if name in information:
+                    await collection.drop_index(name)
+            existing = {tuple(info["key"]) for info in information.values()}
+            missing = [index for index in getattr(model.Settings, "indexes", []) if tuple(index.document["key"].items()) not in existing]
+            return await collection.create_indexes(missing) if missing else []
+
+        created = await asyncio.gather(*(ensure(model) for model in DOCUMENT_MODELS))
+        return [name for names in created for name in names]
+
+    async def explain_queries(self):
+        '''
+        Explains every query the repositories send, and raises `CollectionScanError` when the winning plan of any of them scans a whole collection.
+        Returns the stages of the winning plan of each query.
+        '''
+        database = self.client["WA3"]
+        plans = dict()
+        for name, command in repository_queries():
+            explain = await database.command({"explain": command, "verbosity": "queryPlanner"})
+            plans[name] = winning_stages(explain)
+
+        scans = [name for name, stages in plans.items() if "COLLSCAN" in stages]
+        if scans:
+            raise CollectionScanError(f"Collection scans in: {', '.join(scans)}", plans)
+        return plans
+
+    async def check_health(self):
+        failedPings = 0
+        while True:
+            await asyncio.sleep(self.healthCheckInterval)
+            try:
+                await self.client.admin.command('ping')
+                failedPings = 0
+                self.isHealthy = True
+            except PyMongoError:
+                failedPings += 1
+                self.isHealthy = False
+                if failedPings >= self.maxFailedPings:
+                    failedPings = 0
+                    await self.reconnect()
+
+    async def reconnect(self):
+        previous = self.client
+        try:
+            await self.open()
+        except PyMongoError:
+            self.client = previous # The next failed pings try again
+            return
+        previous.close()
+
+    async def close(self):
+        if self.healthCheck is not None:
+            self.healthCheck.cancel()
+            self.healthCheck = None
+        if self.client is not None:
+            self.client.close()
+            self.client = None
+        self.isHealthy = False
+
+class MemoryUserRepository(UserRepository):
+    def __init__(self):
+        self.users = dict() # key: username, which is the unique index of UserModel
+
+    async def insert(self, *, name, username, hashedPassword):
+        if username in self.users:
+            raise duplicate_key_error("UserModel", {"username": username})
+        user = User(id=str(PydanticObjectId()), name=name, username=username, hashedPassword=hashedPassword)
+        self.users[username] = user
+        return user.id
+
+    async def find_by_username(self, username):
+        return self.users.get(username)
+
+class MemoryQuestionRepository(QuestionRepository):
+    def __init__(self):
+        self.questionIds = dict() # key: fingerprint, which is the unique index of QuestionModel, value: question id
+        self.titles = dict() # key: title, value: list of (Quiz, question id)
+        self.ids = set()
+
+    async def insert(self, title, quiz_obj):
+        return self.add(title, quiz_obj, str(PydanticObjectId()))
+
+    def add(self, title, quiz_obj, questionid):
+        fingerprint = quiz_fingerprint(title, quiz_obj)
+        if fingerprint in self.questionIds:
+            raise duplicate_key_error("QuestionsBank", {"fingerprint": fingerprint})
+        self.questionIds[fingerprint] = questionid
+        self.ids.add(questionid)
+        self.titles.setdefault(title, []).append((quiz_obj.model_copy(update={"fingerprint": fingerprint}), questionid))
+        return questionid
+
+    async def insert_many(self, title, quiz_objs):
+        questionids = []
+        for quiz_obj in quiz_objs:
+            try:
+                questionids.append(await self.insert(title, quiz_obj))
+            except DuplicateKeyError:
+                questionids.append(None)
+        return questionids
+
+    def servable(self, title):
+        return [(quiz_obj, questionid) for quiz_obj, questionid in self.titles.get(title, []) if quiz_obj.keyIndex is not None]
+
+    async def count(self, title):
+        return len(self.servable(title))
+
+    async def sample(self, title, size):
+        pool = self.servable(title)
+        return [(quiz_obj.model_copy(), questionid) for quiz_obj, questionid in random.sample(pool, min(size, len(pool)))]
+
+    async def key_indices(self, title):
+        return list({quiz_obj.keyIndex for quiz_obj, _ in self.titles.get(title, []) if quiz_obj.keyIndex is not None})
+
+    async def export(self, *, title = None, after = None, batchSize = 1000):
+        records = [
+            (questionid, questionTitle, quiz_obj.model_copy())
+            for questionTitle, questions in self.titles.items() if title is None or questionTitle == title
+            for quiz_obj, questionid in questions
+        ]
+        for record in sorted(records, key=lambda record: record[0]): # The ids are ObjectId hex strings, which sort in the order of the ids
+            if after is None or record[0] > after:
+                yield record
+
+    async def insert_exported(self, records):
+        inserted = 0
+        for questionid, title, quiz_obj in records:
+            if questionid in self.ids:
+                continue
+            try:
+                self.add(title, quiz_obj, questionid)
+                inserted += 1
+            except DuplicateKeyError:
+                pass
+        return inserted
+
+class MemoryAttemptRepository(AttemptRepository):
+    def __init__(self):
+        self.attempts = dict() # key: (userId, questionId), which is the unique index of AttemptModel
+
+    async def record_submission(self, *, userId, questionId, isCorrect, timesOfAnswering = 1, timeStamp = None):
+        isNew = (userId, questionId) not in self.attempts
+        attempt = self.attempts.setdefault((userId, questionId), {
+            "timeStamp": timeStamp if timeStamp is not None else datetime.now(),
+            "isCorrect": False,
+            "timesOfAnswering": 0
+        })
+        if attempt["isCorrect"]:
+            return (isNew, False, False)
+        attempt["timesOfAnswering"] += timesOfAnswering
+        attempt["isCorrect"] = isCorrect
+        return (isNew, isCorrect, True)
+
+    async def record_submissions(self, submissions):
+        return {
+            (userId, questionId): await self.record_submission(userId = userId, questionId = questionId, **changes)
+            for (userId, questionId), changes in submissions.items()
+        }
+
+class MemoryProgressRepository(ProgressRepository):
+    def __init__(self, attempts, questions):
+        self.attempts = attempts
+        self.questions = questions
+        self.progress = dict() # key: userId, which is the unique index of ProgressModel, value: dict of title to TitleProgress
+
+    async def add(self, changes):
+        for (userId, title), counters in changes.items():
+            progress = self.progress.setdefault(userId, dict()).setdefault(title, TitleProgress())
+            for name, value in counters.items():
+                setattr(progress, name, getattr(progress, name) + value)
+
+    async def get(self, userId):
+        return {title: progress.model_copy() for title, progress in self.progress.get(userId, dict()).items()}
+
+    async def rebuild(self, userId = None):
+        titles = {questionId: title for title, questions in self.questions.titles.items() for quiz_obj, questionId in questions}
+        rebuilt = dict()
+        for (attemptUserId, questionId), attempt in self.attempts.attempts.items():
+            if (userId is not None and attemptUserId != userId) or questionId not in titles:
+                continue
+            progress = rebuilt.setdefault(attemptUserId, dict()).setdefault(titles[questionId], TitleProgress())
+            progress.attempted += 1
+            progress.correct += attempt["isCorrect"]
+            progress.answers += attempt["timesOfAnswering"]
+        self.progress.update(rebuilt)
+
+class MemoryStorage(StorageBackend):
+    '''
+    Keeps every collection in memory with the same unique indexes as MongoDB, so that the app can be run and benchmarked offline.
+    '''
+    def __init__(self):
+        self.users = MemoryUserRepository()
+        self.questions = MemoryQuestionRepository()
+        self.attempts = MemoryAttemptRepository()
+        self.progress = MemoryProgressRepository(self.attempts, self.questions)
+
+def get_connection_string():
+    '''
+    The connection string is read from the `MONGODB_URI` environment variable, or from the Colab secrets otherwise.
+    '''
+    if "MONGODB_URI" in os.environ:
+        return os.environ["MONGODB_URI"]
+    userdata = lazy_import("google.colab.userdata")
+    return userdata.get("MongoDBAtlasConnectionString") # The connection string will be revoked after WA3 is graded
+
+############################## End of Storage ##############################
+
+############################## Instrumentation ##############################
+
+class Span:
+    def __init__(self, name, parent, attributes):
+        self.name = name
+        self.parent = parent
+        self.attributes = attributes
+        self.counters = dict()
+        self.startTime = datetime.now()
+        self.duration = None
+        self.error = None
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "parent": self.parent.name if self.parent is not None else None,
+            "startTime": self.startTime.isoformat(),
+            "seconds": self.duration,
+            "error": self.error,
+            "attributes": self.attributes,
+            "counters": self.counters,
+        }
+
+class Tracer:
+    '''
+    Times the handlers and the navigations with nested spans, and counts the repository calls and the database commands within each span.
+    The current span is kept in a context variable, so that it follows a handler across awaits and into the tasks it starts.
+    Every finished span is passed to each sink, e.g. `tracer.sinks.append(LogFileSink("trace.jsonl"))`.
+    '''
+    def __init__(self, sinks = None):
+        self.current = contextvars.ContextVar("currentSpan", default=None)
+        self.countLock = threading.Lock() # The commands are counted on the threads of Motor
+        self.sinks = sinks if sinks is not None else []
+        self.loopDepth = 0
+        self.maxLoopDepth = 0
+
+    @contextmanager
+    def span(self, name, **attributes):
+        span = Span(name, self.current.get(), attributes)
+        token = self.current.set(span)
+        start = time.perf_counter()
+        try:
+            yield span
+        except BaseException as e:
+            span.error = type(e).__name__
+            raise
+        finally:
+            span.duration = time.perf_counter() - start
+            self.current.reset(token)
+            for sink in self.sinks:
+                sink.export(span)
+
+    def count(self, name, value = 1):
+        '''
+        Adds to the counter of the current span and of all its parents.
+        '''
+        span = self.current.get()
+        with self.countLock:
+            while span is not None:
+                span.counters[name] = span.counters.get(name, 0) + value
+                span = span.parent
+
+    def run_until_complete(self, awaitable):
+        '''
+        Runs the awaitable on the loop, which nest_asyncio allows to re-enter, and records how deep the loop is re-entered.
+        '''
+        self.loopDepth += 1
+        self.maxLoopDepth = max(self.maxLoopDepth, self.loopDepth)
+        span = self.current.get()
+        if span is not None:
+            span.attributes["loopDepth"] = max(span.attributes.get("loopDepth", 0), self.loopDepth)
+        try:
+            return loop.run_until_complete(awaitable)
+        finally:
+            self.loopDepth -= 1
+
+def traced(spanName, func, *args, **kwargs):
+    with tracer.span(spanName, kind="handler"):
+        return func(*args, **kwargs)
+
+class LogFileSink:
+    '''
+    Appends every finished span to a JSON lines file.
+    '''
+    def __init__(self, path):
+        self.path = path
+
+    def export(self, span):
+        with open(self.path, "a") as f:
+            f.write(json.dumps(span.to_dict()) + "\n")
+
+class PrometheusSink:
+    '''
+    Aggregates the finished spans by kind and name, and `render()` returns them in the Prometheus text format.
+    '''
+    def __init__(self):
+        self.calls = dict() # key: (kind, name)
+        self.errors = dict()
+        self.seconds = dict()
+        self.maxSeconds = dict()
+        self.repositoryCalls = dict()
+        self.dbCommands = dict()
+        self.widgetChanges = dict()
+        self.widgetMessages = dict()
+
+    def export(self, span):
+        key = (span.attributes.get("kind", "span"), span.name)
+        self.calls[key] = self.calls.get(key, 0) + 1
+        self.errors[key] = self.errors.get(key, 0) + (span.error is not None)
+        self.seconds[key] = self.seconds.get(key, 0.0) + span.duration
+        self.maxSeconds[key] = max(self.maxSeconds.get(key, 0.0), span.duration)
+        self.repositoryCalls[key] = self.repositoryCalls.get(key, 0) + span.counters.get("repositoryCalls", 0)
+        self.dbCommands[key] = self.dbCommands.get(key, 0) + span.counters.get("dbCommands", 0)
+        self.widgetChanges[key] = self.widgetChanges.get(key, 0) + span.counters.get("widgetChanges", 0)
+        self.widgetMessages[key] = self.widgetMessages.get(key, 0) + span.counters.get("widgetMessages", 0)
+
+    @staticmethod
+    def labels(key):
+        kind, name = key
+        name = name.replace("\\", "\\\\").replace('"', '\\"')
+        return f'{{kind="{kind}",name="{name}"}}'
+
+    def render(self):
+        lines = []
+        for metric, kind, help_text, values in [
+            ("wa3_span_calls_total", "counter", "Number of finished spans.", self.calls),
+            ("wa3_span_errors_total", "counter", "Number of spans which raised an exception.", self.errors),
+            ("wa3_span_seconds_sum", "counter", "Total seconds spent in the spans.", self.seconds),
+            ("wa3_span_seconds_max", "gauge", "Longest span in seconds.", self.maxSeconds),
+            ("wa3_span_repository_calls_total", "counter", "Repository calls made within the spans.", self.repositoryCalls),
+            ("wa3_span_db_commands_total", "counter", "Commands sent to MongoDB within the spans.", self.dbCommands),
+            ("wa3_span_widget_changes_total", "counter", "Widget trait changes held back by the batches of the spans.", self.widgetChanges),
+            ("wa3_span_widget_messages_total", "counter", "State messages sent to the front end by the batches of the spans.", self.widgetMessages),
+        ]:
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} {kind}")
+            for key, value in sorted(values.items()):
+                lines.append(f"{metric}{self.labels(key)} {value}")
+        lines.append("# HELP wa3_loop_max_depth Deepest nesting of run_until_complete on the event loop.")
+        lines.append("# TYPE wa3_loop_max_depth gauge")
+        lines.append(f"wa3_loop_max_depth {tracer.maxLoopDepth}")
+        return "\n".join(lines) + "\n"
+
+metrics = PrometheusSink()
+tracer = Tracer(sinks=[metrics])
+if "WA3_TRACE_LOG" in os.environ:
+    tracer.sinks.append(LogFileSink(os.environ["WA3_TRACE_LOG"]))
+
+class CountingRepository:
+    '''
+    Counts every call of the wrapped repository as one repository call of the current span.
+    A call may send several commands, which `CommandCounter` counts on MongoDB.
+    '''
+    def __init__(self, repository):
+        self.repository = repository
+
+    def __getattr__(self, name):
+        attr = getattr(self.repository, name)
+        if not inspect.iscoroutinefunction(attr):
+            return attr
+
+        async def counted(*args, **kwargs):
+            tracer.count("repositoryCalls")
+            return await attr(*args, **kwargs)
+        return counted
+
+class CountingStorage(StorageBackend):
+    def __init__(self, backend):
+        self.backend = backend
+        self.users = CountingRepository(backend.users)
+        self.questions = CountingRepository(backend.questions)
+        self.attempts = CountingRepository(backend.attempts)
+        self.progress = CountingRepository(backend.progress)
+
+    async def connect(self):
+        await self.backend.connect()
+
+    async def close(self):
+        await self.backend.close()
+
+############################## End of Instrumentation ##############################
+
+############################## Password Hashing ##############################
+
+class PasswordHasher:
+    '''
+    Runs bcrypt on a thread pool, so that hashing a password does not block the event loop which every widget callback runs on.
+    Threads are enough because bcrypt releases the GIL while hashing.
+    `rounds` is the bcrypt cost factor of new hashes, the cost of an existing hash is read from the hash itself.
+    '''
+    def __init__(self, *, rounds = 12, maxWorkers = 4):
+        self.rounds = rounds
+        self.maxWorkers = maxWorkers
+        self.executor = ThreadPoolExecutor(max_workers=maxWorkers, thread_name_prefix="bcrypt")
+        self.fakeHash = None
+
+    async def run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    async def hash(self, password: str) -> str:
+        bcrypt = lazy_import("bcrypt")
+        hashed = await self.run(bcrypt.hashpw, password.encode("utf-8"), bcrypt.gensalt(rounds=self.rounds))
+        return hashed.decode("utf-8")
+
+    async def check(self, password: str, hashed: Optional[str]) -> bool:
+        '''
+        When the user does not exist, `hashed` is None and a fake hash is checked instead,
+        so that the response time does not tell whether the username exists.
+        Suggested by https://cheatsheetseries.owasp.org/cheatsheets/Authentication_Cheat_Sheet.html#authentication-responses
+        '''
+        bcrypt = lazy_import("bcrypt")
+        if hashed is None:
+            if self.fakeHash is None:
+                self.fakeHash = await self.hash("invalid") # the register function restricted the lenght of password to be at least eight-character long.
+            await self.run(bcrypt.checkpw, password.encode("utf-8"), self.fakeHash.encode("utf-8"))
+            return False
+
+        return await self.run(bcrypt.checkpw, password.encode("utf-8"), hashed.encode("utf-8"))
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+
+async def benchmark_password_hasher(hasher, concurrency = 30, password = "benchmark-password"):
+    '''
+    Checks `concurrency` logins at the same time and reports the throughput,
+    as well as the longest time the event loop was stalled while the logins were running.
+    '''
+    hashed = await hasher.hash(password)
+    maxStall = 0.0
+    isRunning = True
+
+    async def ticker():
+        nonlocal maxStall
+        while isRunning:
+            before = time.perf_counter()
+            await asyncio.sleep(0.01)
+            maxStall = max(maxStall, time.perf_counter() - before - 0.01)
+
+    ticker_task = asyncio.ensure_future(ticker())
+    start = time.perf_counter()
+    results = await asyncio.gather(*(hasher.check(password, hashed) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    isRunning = False
+    await ticker_task
+
+    if not all(results):
+        raise RuntimeError("A benchmark login was rejected.")
+
+    return {
+        "rounds": hasher.rounds,
+        "maxWorkers": hasher.maxWorkers,
+        "concurrency": concurrency,
+        "seconds": elapsed,
+        "loginsPerSecond": concurrency / elapsed,
+        "maxEventLoopStallSeconds": maxStall,
+    }
+
+passwordHasher = PasswordHasher()
+
+############################## End of Password Hashing ##############################
+
+############################## Sessions ##############################
+
+class SessionManager:
+    '''
+    Issues a signed token after a successful login, and keeps the profile of the user in a bounded LRU cache keyed by the token,
+    so that a returning user resumes without another bcrypt check or database read.
+    A token is `userId.expiresAt.nonce.signature`, signed with HMAC-SHA256, and it is only honoured until `expiresAt` and while its profile is cached.
+    The secret is read from `WA3_SESSION_SECRET`, or generated per process otherwise.
+    '''
+    def __init__(self, *, secret = None, ttlSeconds = 30 * 60, maxSessions = 256):
+        if secret is None:
+            secret = os.environ.get("WA3_SESSION_SECRET")
+        self.secret = secret.encode() if isinstance(secret, str) else (secret or secrets.token_bytes(32))
+        self.ttlSeconds = ttlSeconds
+        self.maxSessions = maxSessions
+        self.profiles = OrderedDict() # key: token, value: profile of the user, from the least to the most recently used
+
+    def sign(self, payload):
+        return hmac.new(self.secret, payload.encode(), hashlib.sha256).hexdigest()
+
+    def issue(self, user):
+        payload = f"{user.id}.{int(time.time()) + self.ttlSeconds}.{secrets.token_urlsafe(12)}"
+        token = f"{payload}.{self.sign(payload)}"
+        self.profiles[token] = {"id": user.id, "name": user.name, "username": user.username}
+        while len(self.profiles) > self.maxSessions:
+            self.profiles.popitem(last=False)
+        return token
+
+    def resume(self, token):
+        '''
+        Returns the profile of a valid token, or None.
+        '''
+        payload, _, signature = (token or "").rpartition(".")
+        if not payload or not hmac.compare_digest(signature, self.sign(payload)):
+            return None
+
+        userId, expiresAt, _ = payload.split(".", 2)
+        profile = self.profiles.get(token)
+        if profile is None or profile["id"] != userId:
+            return None
+        if int(expiresAt) < time.time():
+            del self.profiles[token]
+            return None
+
+        self.profiles.move_to_end(token)
+        return profile
+
+    def revoke(self, token):
+        self.profiles.pop(token, None)
+
+sessionManager = SessionManager()
+
+############################## End of Sessions ##############################
+
 ############################## Nerfed MVC framework ##############################
 
+class WidgetSpec():
+    '''
+    Declares a widget of a view without creating it. For example: helloworld = WidgetSpec(widgets.HTML, "Hello World")
+    Each instance of the view creates its own widget the first time the attribute is read, which is when the view is bound or rendered.
+    The arguments may hold other specs of the same view, e.g. the children of a box, and they are replaced with the widgets of that instance.
+    `isIgnored` leaves the widget out of the rendered list, as it is shown inside another widget.
+    '''
+    def __init__(self, factory, *args, isIgnored = False, **kwargs):
+        self.factory = factory
+        self.args = args
+        self.kwargs = kwargs
+        self.isIgnored = isIgnored
+        self.name = None
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, view, owner):
+        if view is None:
+            return self
+        widget = self.factory(*self.resolve(self.args, view), **self.resolve(self.kwargs, view))
+        view.__dict__[self.name] = widget # The widget shadows the spec, so the next reads do not come here
+        return widget
+
+    @classmethod
+    def resolve(cls, value, view):
+        if isinstance(value, WidgetSpec):
+            return getattr(view, value.name)
+        if isinstance(value, (list, tuple)):
+            return type(value)(cls.resolve(item, view) for item in value)
+        if isinstance(value, dict):
+            return {key: cls.resolve(item, view) for key, item in value.items()}
+        return value
+
+    def is_a(self, widgetType):
+        return isinstance(self.factory, type) and issubclass(self.factory, widgetType)
+
+def close_all(widget):
+    for child in getattr(widget, "children", tuple()):
+        close_all(child)
+    widget.close()
+
 class ViewBase():
+    isRestreamed = False # Whether the stream is appended again every time the view is shown from the cache
+
     def __init_subclass__(cls):
         '''
-        This allows the base class to access all static UIs in the subclass during runtime, without using metaclass.
+        This allows the base class to access all UI specs in the subclass during runtime, without using metaclass.
+        No widget is created here, so that importing the module and registering the controllers stays cheap.
         '''
-        cls.widgetsattr = {}
+        cls.widgetspecs = {}
         cls.renderlist = []
-        for name, val in vars(cls).items():
-            if name.startswith("__") or name == "widgetsattr" or name == "renderlist":
+        for name, val in list(vars(cls).items()):
+            if name.startswith("__") or name in ["widgetspecs", "renderlist", "isRestreamed"]:
                 continue
 
-            if isinstance(val, widgets.Widget):
+            if isinstance(val, WidgetSpec):
                 '''
-                This adds simple UI. For example: helloworld = ipwidgets.widgets.HTML("Hello World")
+                This adds simple UI. For example: helloworld = WidgetSpec(widgets.HTML, "Hello World")
                 '''
-                cls.widgetsattr[name] = val
-                if not getattr(val, "isIgnored", False):
-                    cls.renderlist.append(val)
+                cls.widgetspecs[name] = val
+                if not val.isIgnored:
+                    cls.renderlist.append(name)
 
-            elif isinstance(val, list) and all(isinstance(w, widgets.Widget) for w in val):
+            elif isinstance(val, (list, types.GeneratorType)):
                 '''
-                This adds a list of simple UIs.
-                '''
-                for index, widget_val in enumerate(val):
-                    cls.widgetsattr[f"{name}_index_{index}"] = widget_val
-                    cls.renderlist.append(widget_val)
-
-            elif isinstance(val, types.GeneratorType):
-                '''
-                This adds a list of simple UIs from a generator such as from the `yield` keyword.
+                This adds a list of simple UIs, also from a generator such as from the `yield` keyword.
                 '''
                 the_list = list(val)
-                if all(isinstance(w, widgets.Widget) for w in the_list):
-                    for index, widget_val in enumerate(the_list):
-                        cls.widgetsattr[f"{name}_index_{index}"] = widget_val
-                        cls.renderlist.append(widget_val)
+                if the_list and all(isinstance(spec, WidgetSpec) for spec in the_list):
+                    for index, spec in enumerate(the_list):
+                        spec.name = f"{name}_index_{index}"
+                        setattr(cls, spec.name, spec)
+                        cls.widgetspecs[spec.name] = spec
+                        cls.renderlist.append(spec.name)
 
     def __init__(self, appstate):
         self.appstate = appstate
-        self.widgets_attr_dict = self.__class__.widgetsattr.copy()
-
-        for name, widget in self.widgets_attr_dict.items():
-            setattr(self, name, widget)
-
-        self.widgets = self.__class__.renderlist.copy()
+        self.widgets = [getattr(self, name) for name in self.__class__.renderlist] # A view is only built when it is shown
+        self.links = []
+        self.rendered = None
         self.link()
 
     def to_render(self) -> widgets.VBox:
-        return widgets.VBox(
-                self.widgets,
-                layout = widgets.Layout(
-                    max_width ="100%",
-                    align_items="center"
+        '''
+        The container is built once and reused whenever the view is shown again.
+        '''
+        if self.rendered is None:
+            self.rendered = widgets.VBox(
+                    self.widgets,
+                    layout = widgets.Layout(
+                        max_width ="100%",
+                        align_items="center"
+                        )
                     )
-                )
+        return self.rendered
+
+    def created_widgets(self):
+        return [self.__dict__[name] for name in self.__class__.widgetspecs if name in self.__dict__]
+
+    def destroy(self):
+        '''
+        Removes the trait links of this view and closes its widgets, which belong to this instance only.
+        '''
+        for link in self.links:
+            link.unlink()
+        self.links.clear()
+
+        for widget in self.created_widgets() + self.widgets:
+            close_all(widget)
+        for name in self.__class__.widgetspecs:
+            self.__dict__.pop(name, None)
+        self.widgets = []
+
+        if self.rendered is not None:
+            self.rendered.close()
+            self.rendered = None
 
     def link(self):
         '''
@@ -133,18 +1469,181 @@ class ViewBase():
         '''
         pass
 
+    def stream(self):
+        '''
+        This allows adding widgets after the view is displayed, such as the ones that have to wait for the database.
+        A subclass returns an async generator of widgets, and each yielded widget is appended to the live view.
+        '''
+        return None
+
+    def append(self, widget):
+        self.widgets.append(widget)
+        if self.rendered is not None:
+            self.rendered.children += (widget,)
+
+    async def append_stream(self):
+        stream = self.stream()
+        if stream is None:
+            return
+        async for widget in stream:
+            self.append(widget)
+
+    def clear_stream(self):
+        '''
+        Takes the widgets appended by the stream out of the view, so that the stream can be appended again.
+        '''
+        count = len(self.__class__.renderlist)
+        appended = self.widgets[count:]
+        del self.widgets[count:]
+        if self.rendered is not None:
+            self.rendered.children = tuple(self.widgets)
+        for widget in appended:
+            self.discard(widget)
+
+    def discard(self, widget):
+        '''
+        Called for each widget taken out by `clear_stream`. A subclass may keep the widget for later instead of closing it.
+        '''
+        close_all(widget)
+
     def binder(self, widget, nameoftrait, transform=None):
         '''
         A helper method that explicitly link the app state trait to the expected widget.
         '''
         if isinstance(widget, widgets.Widget) and hasattr(self.appstate, nameoftrait):
             if transform:
-                dlink((self.appstate, nameoftrait), (widget, "value"), transform=transform)
+                self.links.append(dlink((self.appstate, nameoftrait), (widget, "value"), transform=transform))
             else:
-                dlink((self.appstate, nameoftrait), (widget, "value"))
+                self.links.append(dlink((self.appstate, nameoftrait), (widget, "value")))
         else:
             raise TypeError(f"Expected Widget type and valid trait name. Got widget: {type(widget)}, name of trait: {nameoftrait}")
 
+def cancel_previous(func):
+    '''
+    Marks a handler whose new click cancels its run in progress, instead of being dropped until that run finishes.
+    '''
+    func.isCancellingPrevious = True
+    return func
+
+class EventDispatcher:
+    '''
+    Schedules the coroutines of the handlers as tasks on the event loop, so that a click returns at once and the I/O of independent handlers overlaps.
+    Every key (a widget, or a controller for its stream) has at most one task in flight:
+    a new dispatch is dropped while it runs or within `debounceSeconds` of the previous one, unless it cancels the previous task.
+    When the loop is not running, e.g. in a plain script, the loop is driven until the task finishes.
+    '''
+    def __init__(self, *, debounceSeconds = 0.0):
+        self.debounceSeconds = debounceSeconds
+        self.tasks = dict() # key: key of the dispatch, value: task in flight
+        self.lastDispatch = dict()
+        self.errors = []
+
+    def dispatch(self, key, coroutine, *, isCancellingPrevious = False):
+        task = self.tasks.get(key)
+        if task is not None and not task.done():
+            if not isCancellingPrevious:
+                coroutine.close()
+                return task
+            task.cancel()
+        elif time.monotonic() - self.lastDispatch.get(key, -math.inf) < self.debounceSeconds:
+            coroutine.close()
+            return task
+
+        self.lastDispatch[key] = time.monotonic()
+        task = asyncio.ensure_future(coroutine)
+        self.tasks[key] = task
+        task.add_done_callback(lambda task, key=key: self.finish(key, task))
+        if not loop.is_running():
+            tracer.run_until_complete(asyncio.wait([task]))
+        return task
+
+    def finish(self, key, task):
+        if self.tasks.get(key) is task:
+            del self.tasks[key]
+        if not task.cancelled() and task.exception() is not None:
+            self.report(key, task.exception())
+
+    def report(self, key, error):
+        '''
+        The error of a task has no caller to raise into, so it is kept and printed.
+        '''
+        self.errors.append((key, error))
+        print(f"Error in the handler of {key}:", file=sys.stderr)
+        traceback.print_exception(type(error), error, error.__traceback__)
+
+    async def join(self):
+        '''
+        Waits until no task is in flight, including the tasks dispatched meanwhile.
+        '''
+        while self.tasks:
+            await asyncio.wait(list(self.tasks.values()))
+
+dispatcher = EventDispatcher()
+
+class WidgetSyncBatch:
+    '''
+    Holds back the state messages of the given widgets with their own `hold_sync`, and sends one message per widget when the handler finishes.
+    Only the traits whose final value differs from the one before the handler are sent, so that e.g. hiding and showing again sends nothing.
+    An `Output` is never held, as it must sync its `msg_id` at once to capture what is displayed inside it.
+    '''
+    def __init__(self):
+        self.originals = dict() # key: widget, value: dict of trait name and its value before the batch
+        self.holds = ExitStack()
+
+    def hold(self, *roots):
+        for widget in self.synced_widgets(roots):
+            # A widget being built has no front end yet, and one held by an outer batch is sent by that batch
+            if widget.comm is None or widget._holding_sync or isinstance(widget, widgets.Output):
+                continue
+            self.originals[widget] = {name: getattr(widget, name) for name in widget.keys}
+            self.holds.enter_context(widget.hold_sync())
+
+    @staticmethod
+    def synced_widgets(roots):
+        '''
+        The widgets under the roots, with their layouts and styles, which are widgets of their own.
+        '''
+        stack = list(roots)
+        while stack:
+            widget = stack.pop()
+            if not isinstance(widget, widgets.Widget):
+                continue
+            yield widget
+            stack.extend(getattr(widget, "children", tuple()))
+            stack.extend(getattr(widget, name, None) for name in ["layout", "style"])
+
+    def flush(self):
+        changes = messages = 0
+        for widget, originals in self.originals.items():
+            changes += len(widget._states_to_send)
+            widget._states_to_send.difference_update([name for name in list(widget._states_to_send) if self.is_same(getattr(widget, name), originals.get(name))])
+            if widget._states_to_send and widget.comm is not None:
+                messages += 1
+        self.originals.clear()
+        self.holds.close() # Every `hold_sync` sends what is left in its `_states_to_send`
+        tracer.count("widgetChanges", changes)
+        tracer.count("widgetMessages", messages)
+        return messages
+
+    @staticmethod
+    def is_same(value, old):
+        try:
+            return bool(value == old)
+        except Exception:
+            return False
+
+@contextmanager
+def coalesced_sync(*roots):
+    '''
+    Holds the widgets under `roots` in a new `WidgetSyncBatch`, which is sent when the body exits.
+    '''
+    batch = WidgetSyncBatch()
+    batch.hold(*roots)
+    try:
+        yield batch
+    finally:
+        batch.flush()
+
 class ControllerBase(ABC):
     @abstractmethod
     def __init__(self, appstate, router):
@@ -159,36 +1658,81 @@ class ControllerBase(ABC):
             raise TypeError(f"Invalid _obj_view attr. Required ViewBase subclass, got {type(self._obj_view)}")
 
     def binding(self):
-        for name, widget in self.view.widgets_attr_dict.items():
-            func = None
-
-            if isinstance(widget, widgets.Button):
-                func = getattr(self, f"on_{name}")
-            else:
+        for name, spec in self.view.widgetspecs.items():
+            if not spec.is_a(widgets.Button):
                 continue
+            widget = getattr(self.view, name)
+            func = getattr(self, f"on_{name}")
 
             widget._click_handlers.callbacks.clear()
+            spanName = f"{self.__class__.__name__}.on_{name}"
             if inspect.iscoroutinefunction(func):
-                async def wrapper(_, f=func, w=widget):
-                    w.disabled = True
-                    await f(_)
-                    w.disabled = False
-
-                widget.on_click(lambda _: loop.run_until_complete(wrapper(_)))
+                async def wrapper(_, f=func, w=widget, spanName=spanName):
+                    with tracer.span(spanName, kind="handler"):
+                        w.disabled = True # Outside of the batch, so that the button is disabled at once
+                        try:
+                            with coalesced_sync(*self.view.widgets):
+                                await f(_)
+                        finally:
+                            w.disabled = False
+
+                widget.on_click(
+                    lambda _, wrapper=wrapper, w=widget, isCancellingPrevious=getattr(func, "isCancellingPrevious", False):
+                    dispatcher.dispatch(w, wrapper(_), isCancellingPrevious=isCancellingPrevious)
+                )
 
             else:
-                def wrapper(_, f=func, w=widget):
-                    w.disabled = True
-                    f(_)
-                    w.disabled = False
+                def wrapper(_, f=func, w=widget, spanName=spanName):
+                    with tracer.span(spanName, kind="handler"):
+                        w.disabled = True
+                        with coalesced_sync(*self.view.widgets):
+                            f(_)
+                        w.disabled = False
                 widget.on_click(wrapper)
 
-    def show(self):
-        self.view = self._obj_view(self.appstate)
-        self.binding()
-        self.router.container.clear_output()
-        with self.router.container:
-            display(self.view.to_render())
+    def show(self, isRebuild=False):
+        isNew = self.present(isRebuild)
+        dispatcher.dispatch(self, self.update_view(isNew), isCancellingPrevious=True) # A rebuilt view cancels the stream of the previous one
+
+    async def show_async(self, isRebuild=False):
+        await self.update_view(self.present(isRebuild))
+
+    async def update_view(self, isNew):
+        with tracer.span(f"{self.__class__.__name__}.update", kind="stream"):
+            await self.refresh()
+            if isNew:
+                await self.view.append_stream()
+            elif self.view.isRestreamed:
+                self.view.clear_stream()
+                await self.view.append_stream()
+
+    async def refresh(self):
+        '''
+        Called every time the view is shown, including when it is taken from the cache, to load the data which may have changed since.
+        '''
+        pass
+
+    def present(self, isRebuild=False):
+        '''
+        The view is built and bound only once, and then taken from the cache of the router until it is invalidated.
+        Returns whether the view is new, so that its stream still has to be appended.
+        '''
+        name = self.__class__.__name__
+        if isRebuild:
+            self.router.invalidate(self.__class__)
+
+        isNew = name not in self.router.views
+        if isNew:
+            self.router.views[name] = self._obj_view(self.appstate)
+            self.view = self.router.views[name]
+            self.binding()
+
+        self.view = self.router.views[name]
+        if not self.router.isHeadless:
+            self.router.container.clear_output()
+            with self.router.container:
+                display(self.view.to_render())
+        return isNew
 
 class AppState(HasTraits):
     '''
@@ -196,13 +1740,20 @@ class AppState(HasTraits):
     '''
     userId = Unicode()
     name = Unicode()
+    sessionToken = Unicode() # Kept after signing out, so that the user can resume
 
 class Router:
-    def __init__(self):
+    '''
+    A headless router never displays anything, so that the controllers can be driven without a notebook front end.
+    '''
+    def __init__(self, isHeadless=False):
         self.appstate = AppState()
         self.controllers = dict()
+        self.views = dict() # key: controller name, value: cached view instance
+        self.isHeadless = isHeadless
         self.container = widgets.Output()
-        display(self.container)
+        if not isHeadless:
+            display(self.container)
 
     def register_one(self, controller: ControllerBase):
         '''
@@ -214,171 +1765,722 @@ class Router:
 
         self.controllers[controller.__name__] = controller(self.appstate, self)
 
-    def go(self, controller: ControllerBase):
+    def go(self, controller: ControllerBase, isRebuild=False):
         '''
         `controller` argument takes ControllerBase object.
         This function go the given `controller`
+        `isRebuild` discards the cached view of the `controller` and builds a new one.
+        '''
+        with tracer.span(f"Router.go {controller.__name__}", kind="navigation"):
+            self.controllers[controller.__name__].show(isRebuild=isRebuild)
+
+    async def go_async(self, controller: ControllerBase, isRebuild=False):
+        '''
+        The same as `go`, but the stream of the view is awaited instead of being run to completion on the loop.
+        '''
+        with tracer.span(f"Router.go {controller.__name__}", kind="navigation"):
+            await self.controllers[controller.__name__].show_async(isRebuild=isRebuild)
+
+    def invalidate(self, controller: ControllerBase):
+        '''
+        Discards the cached view of the given `controller`, it will be built again on the next `go`.
+        '''
+        view = self.views.pop(controller.__name__, None)
+        if view is not None:
+            view.destroy()
+
+    def reset(self):
+        '''
+        Discards every cached view.
         '''
-        self.controllers[controller.__name__].show()
+        for name in list(self.views.keys()):
+            self.invalidate(self.controllers[name].__class__)
 
 ############################## End of Nerfed MVC framework ##############################
 
+############################## Question Generators ##############################
+
+class KeySpaceExhaustedError(Exception):
+    pass
+
+class QuestionKeySpace:
+    '''
+    Keeps track of the unused parameter indices of a title, so that a generator never draws a question that is already in the bank.
+    `free` holds the unused indices and `position` holds where each index sits in `free`,
+    so that drawing an unused index and marking an index as used are both O(1).
+    '''
+    registry = dict() # key: (title, name of the key space), value: QuestionKeySpace instance
+
+    def __init__(self, title, size):
+        self.title = title
+        self.size = size
+        self.free = array("I", range(size))
+        self.position = array("I", range(size))
+        self.isLoaded = False
+
+    @classmethod
+    async def load(cls, title, size, *, name = None, local_index = None):
+        '''
+        The used indices are read from the database only once per key space.
+        A title may have several key spaces, e.g. one per difficulty, which share the saved `keyIndex` values:
+        `local_index` maps a saved index into this key space, or to None when it lies outside of it.
+        '''
+        key_space = cls.registry.get((title, name))
+        if key_space is None or key_space.size != size:
+            key_space = cls(title, size)
+            cls.registry[(title, name)] = key_space
+
+        if not key_space.isLoaded:
+            for index in await storage.questions.key_indices(title):
+                index = local_index(index) if local_index is not None else index
+                if index is not None:
+                    key_space.mark_used(index)
+            key_space.isLoaded = True
+        return key_space
+
+    def __len__(self):
+        return len(self.free)
+
+    def is_used(self, index):
+        pos = self.position[index]
+        return pos >= len(self.free) or self.free[pos] != index
+
+    def mark_used(self, index):
+        if not 0 <= index < self.size or self.is_used(index):
+            return
+        pos = self.position[index]
+        last = self.free[-1]
+        self.free[pos] = last
+        self.position[last] = pos
+        self.free.pop()
+
+    def draw(self):
+        if not self.free:
+            raise KeySpaceExhaustedError(f"All {self.size} questions of '{self.title}' have been generated.")
+        index = self.free[random.randrange(len(self.free))]
+        self.mark_used(index)
+        return index
+
+def normalize_parameter(parameter):
+    if isinstance(parameter, (int, float, Fraction)) and not isinstance(parameter, bool):
+        return str(Fraction(parameter)) # 2, 2.0 and Fraction(4, 2) are the same parameter
+    return " ".join(str(parameter).split())
+
+def question_fingerprint(title, parameters):
+    '''
+    A signed 64-bit hash of the title and the normalized parameters, so that MongoDB stores it as a long.
+    '''
+    canonical = json.dumps([title, [normalize_parameter(parameter) for parameter in parameters]], separators=(",", ":"))
+    return int.from_bytes(hashlib.blake2b(canonical.encode(), digest_size=8).digest(), "big", signed=True)
+
+def quiz_fingerprint(title, quiz_obj):
+    '''
+    The questions which do not come from a `QuestionGenerator` have no parameters, so that their text is fingerprinted instead.
+    '''
+    if quiz_obj.fingerprint is not None:
+        return quiz_obj.fingerprint
+    return question_fingerprint(title, ["text", quiz_obj.question])
+
+class BloomFilter:
+    '''
+    A set of fingerprints which may answer that an absent fingerprint is present, but never the opposite.
+    With the default `sizeBits` and `hashes`, about 1% of the absent fingerprints are reported present once it holds 100000 of them.
+    '''
+    def __init__(self, *, sizeBits = 1 << 20, hashes = 7):
+        self.sizeBits = sizeBits
+        self.hashes = hashes
+        self.bits = bytearray(sizeBits // 8)
+
+    def positions(self, fingerprint):
+        # Double hashing from the two halves of the 64-bit fingerprint
+        fingerprint &= (1 << 64) - 1
+        first, second = fingerprint >> 32, (fingerprint & 0xFFFFFFFF) | 1
+        return [(first + i * second) % self.sizeBits for i in range(self.hashes)]
+
+    def add(self, fingerprint):
+        for position in self.positions(fingerprint):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, fingerprint):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self.positions(fingerprint))
+
+knownQuestions = BloomFilter() # The fingerprints of the questions known to be in the bank
+
+class QuestionGenerator(ABC):
+    '''
+    A generator whose questions are fully described by a parameter tuple.
+    Every parameter tuple has an index in `range(keySpaceSize)`, and only the unused indices are drawn.
+    A subclass which draws from a part of the parameter tuples of its title names that part with `keySpaceName`,
+    and saves `key_index(index)` as `keyIndex`, so that every generator of the title reads the saved indices alike.
+    '''
+    keySpaceSize = 0
+    keySpaceName = None
+
+    def __init__(self, title):
+        self.title = title
+        self.key_space = None
+
+    async def prepare(self):
+        self.key_space = await QuestionKeySpace.load(self.title, self.keySpaceSize, name=self.keySpaceName, local_index=self.local_index)
+
+    def key_index(self, index):
+        '''
+        The `keyIndex` saved for an index of this key space.
+        '''
+        return index
+
+    def local_index(self, keyIndex):
+        '''
+        The index in this key space of a saved `keyIndex`, or None when it lies outside of it.
+        '''
+        return keyIndex
+
+    def __call__(self):
+        if self.key_space is None:
+            raise RuntimeError(f"{type(self).__name__}.prepare() must be awaited before generating questions.")
+        index = self.key_space.draw()
+        parameters = self.parameters(index)
+        quiz_obj = self.make(parameters)
+        quiz_obj.keyIndex = self.key_index(index)
+        quiz_obj.fingerprint = question_fingerprint(self.title, parameters)
+        return quiz_obj
+
+    def make_batch(self, count):
+        '''
+        Draws up to `count` unused indices, fewer only when the key space runs out, and makes their questions.
+        Subclasses which can make many questions at once override `make_many`.
+        '''
+        if self.key_space is None:
+            raise RuntimeError(f"{type(self).__name__}.prepare() must be awaited before generating questions.")
+        if not self.key_space:
+            self.key_space.draw() # Raises KeySpaceExhaustedError
+        indices = [self.key_space.draw() for x in range(min(count, len(self.key_space)))]
+        return self.make_many(indices)
+
+    def make_many(self, indices):
+        quiz_objs = []
+        for index in indices:
+            parameters = self.parameters(index)
+            quiz_obj = self.make(parameters)
+            quiz_obj.keyIndex = self.key_index(index)
+            quiz_obj.fingerprint = question_fingerprint(self.title, parameters)
+            quiz_objs.append(quiz_obj)
+        return quiz_objs
+
+    @abstractmethod
+    def parameters(self, index) -> tuple:
+        pass
+
+    @abstractmethod
+    def make(self, parameters) -> Quiz:
+        pass
+
+############################## End of Question Generators ##############################
+
+############################## Answer Checking ##############################
+'''
+An answer is compared by its canonical form: the sorted set of its roots as exact fractions, e.g. "x=3, x=-2", "-2,3" and "3 ; -2" are all "-2,3".
+A decimal with at least two decimal places counts as the fraction with a small denominator it rounds from, so that "-0.33" is -1/3.
+The examples in `canonical_answer` are run with `python -m doctest WA3.py`.
+'''
+
+NUMBER_PATTERN = re.compile(r"[-+]?\s*\d+(?:\.\d+)?(?:\s*/\s*[-+]?\s*\d+)?") # A sign or a slash may be spaced out, e.g. "- 2" or "3 / -2"
+VARIABLE_PATTERN = re.compile(r"[a-zA-Z][\w{}\u2080-\u2089]*\s*=") # The name before "=", e.g. "x", "x1", "x_2" or "x\u2081"
+MAX_DENOMINATOR = 9 # The fractions up to ninths are more than 1/100 apart, so that a decimal with two places rounds from at most one of them
+
+def parse_number(token):
+    token = "".join(token.split())
+    if "/" in token:
+        numerator, denominator = token.split("/")
+        return Fraction(int(numerator), int(denominator)) if int(denominator) != 0 else None
+    if "." not in token:
+        return Fraction(int(token))
+
+    value = Fraction(token)
+    decimals = token.split(".")[1]
+    if len(decimals) < 2: # "0.3" is nearer 2/7 than 1/3, so that one decimal place is taken as written
+        return value
+    snapped = value.limit_denominator(MAX_DENOMINATOR)
+    tolerance = Fraction(5, 10 ** (len(decimals) + 1)) # Half a unit in the last written digit
+    return snapped if abs(snapped - value) <= tolerance else value
+
+def canonical_roots(roots):
+    return ",".join(str(root) for root in sorted(set(roots)))
+
+@lru_cache(maxsize=4096)
+def canonical_answer(text):
+    '''
+    Returns the canonical form of an answer, or None when it has no numbers, in which case it is compared as plain text.
+    Many students submit the same strings, so that the parsed forms are cached.
+
+    >>> [canonical_answer(text) for text in ["x=3, x=-2", "-2,3", "3 ; -2", "x1 = 3, x2 = -2", "x_1=3; x_2=-2", "x\u2081 = 3"]]
+    ['-2,3', '-2,3', '-2,3', '-2,3', '-2,3', '3']
+    >>> [canonical_answer(text) for text in ["2.5", "-0.33", "0.67", "1/3", "\u22121/2", "4/2, 2"]]
+    ['5/2', '-1/3', '2/3', '1/3', '-1/2', '2']
+    >>> [canonical_answer(text) for text in ["0.52", "0.48", "0.45", "0.3", "1/0", "no idea"]]
+    ['13/25', '12/25', '9/20', '3/10', None, None]
+    >>> [canonical_answer(text) for text in ["x = - 2, 3", "x = + 3", "3/-2", "- 3 / 2", "1 / - 2"]]
+    ['-2,3', '3', '-3/2', '-3/2', '-1/2']
+    '''
+    tokens = NUMBER_PATTERN.findall(VARIABLE_PATTERN.sub(" ", text.replace("\u2212", "-")))
+    roots = [parse_number(token) for token in tokens]
+    if not roots or None in roots:
+        return None
+    return canonical_roots(roots)
+
+def is_correct_answer(submission, quiz_obj):
+    if quiz_obj.canonicalAnswer is None:
+        return submission.strip() == quiz_obj.answer
+    return canonical_answer(submission) == quiz_obj.canonicalAnswer
+
+############################## End of Answer Checking ##############################
+
+############################## Attempt Recording ##############################
+
+class AttemptRecorder:
+    '''
+    A write-behind buffer of the submissions, so that the submit button does not wait for the database.
+    The submissions of the same question by the same user are coalesced in memory,
+    and written every `flushInterval` seconds with `AttemptRepository.record_submissions`:
+    `timesOfAnswering` is added up, and `isCorrect` can only go from False to True.
+    When `flushInterval` is None, every submission is written straight away with `AttemptRepository.record_submission`.
+    The outcomes of the written submissions are added to the progress of the users.
+    The flushes run one at a time, so that an explicit `flush` also waits for the one of the background task which is in flight.
+    '''
+    def __init__(self, *, flushInterval = 2.0):
+        self.flushInterval = flushInterval
+        self.buffer = dict() # key: (userId, questionId), value: the pending changes of the attempt
+        self.titles = dict() # key: questionId, value: title of the question
+        self.task = None
+        self.writes = set() # The write-through tasks in flight
+        self.lock = asyncio.Lock()
+
+    def record(self, *, userId, questionId, isCorrect, title = None):
+        '''
+        Records one submission of a question that has not been answered correctly before.
+        '''
+        if title is not None:
+            self.titles[questionId] = title
+
+        if self.flushInterval is None:
+            write = asyncio.ensure_future(self.write_through(userId = userId, questionId = questionId, isCorrect = isCorrect))
+            self.writes.add(write)
+            write.add_done_callback(self.writes.discard)
+            return
+
+        self.merge((userId, questionId), {
+            "timesOfAnswering": 1,
+            "isCorrect": isCorrect,
+            "timeStamp": datetime.now()
+        })
+
+        if self.task is None or self.task.done():
+            self.task = contextvars.Context().run(asyncio.ensure_future, self.run()) # The flushes do not belong to the span of the submission
+
+    def merge(self, key, changes):
+        pending = self.buffer.get(key)
+        if pending is None:
+            self.buffer[key] = changes
+        else:
+            pending["timesOfAnswering"] += changes["timesOfAnswering"]
+            pending["isCorrect"] = pending["isCorrect"] or changes["isCorrect"]
+            pending["timeStamp"] = min(pending["timeStamp"], changes["timeStamp"])
+
+    async def run(self):
+        while self.buffer:
+            await asyncio.sleep(self.flushInterval)
+            try:
+                with tracer.span("AttemptRecorder.flush", kind="background"):
+                    await self.flush()
+            except PyMongoError:
+                pass # The changes are kept in the buffer and written on the next round
+
+    async def write_through(self, *, userId, questionId, isCorrect):
+        outcome = await storage.attempts.record_submission(userId = userId, questionId = questionId, isCorrect = isCorrect)
+        await storage.progress.add(self.progress_changes({(userId, questionId): outcome}, {(userId, questionId): {"timesOfAnswering": 1}}))
+
+    async def flush(self):
+        '''
+        Returns when every submission recorded so far is written, including the ones of a flush or a write-through already in flight.
+        When the progress cannot be written after the attempts were, it is not retried, as that would count the attempts again.
+        `ProgressRepository.rebuild` brings it back in line with the attempts.
+        '''
+        if self.writes:
+            await asyncio.gather(*self.writes, return_exceptions=True)
+
+        async with self.lock:
+            if not self.buffer:
+                return
+
+            pending, self.buffer = self.buffer, dict()
+            try:
+                outcomes = await storage.attempts.record_submissions(pending)
+            except PyMongoError:
+                for key, changes in pending.items():
+                    self.merge(key, changes)
+                raise
+            await storage.progress.add(self.progress_changes(outcomes, pending))
+
+    async def close(self):
+        '''
+        Writes the pending submissions and stops the background task, so that it does not retry against a closed client.
+        '''
+        try:
+            await self.flush()
+        finally:
+            if self.task is not None:
+                self.task.cancel()
+                self.task = None
+
+    def progress_changes(self, outcomes, submissions):
+        changes = dict() # key: (userId, title), value: increments of the counters
+        for (userId, questionId), (isNew, isNewlyCorrect, isCounted) in outcomes.items():
+            title = self.titles.get(questionId)
+            if title is None:
+                continue
+            counters = changes.setdefault((userId, title), {"attempted": 0, "correct": 0, "answers": 0})
+            counters["attempted"] += isNew
+            counters["correct"] += isNewlyCorrect
+            counters["answers"] += submissions[(userId, questionId)]["timesOfAnswering"] if isCounted else 0
+        return changes
+
+attemptRecorder = AttemptRecorder()
+
+############################## End of Attempt Recording ##############################
+
 class QuizHelper:
     '''
     the 'question' argument must be a calleable function which returns the quiz class
+    When `isBatched` is True, the questions are generated in memory first and written with a single unordered `insert_many`,
+    so that only the collided questions are generated again.
+    When `isBatched` is False, every question slot is generated and inserted on its own, with at most `maxConcurrency` slots in flight,
+    so that the page waits for the slowest insert instead of the sum of all of them.
+    A question slot gives up with `KeySpaceExhaustedError` after `maxRetries` collisions instead of retrying forever.
+    When `isReusing` is True and the bank already holds at least `poolFloor` questions of the title,
+    the questions are sampled from the bank instead of being generated and inserted.
+    The widgets of the questions are taken from `cardPool`, so that a view which keeps its pool reuses the cards of its previous quiz.
     '''
-    def __init__(self, *, appstate, quiz, title:str, numberOfQuestions = 5):
+    poolSizes = dict() # key: title, value: the last known number of questions of the title in the bank
+
+    def __init__(self, *, appstate, quiz, title:str, numberOfQuestions = 5, isBatched = True, maxRetries = 10, isReusing = True, poolFloor = 50, maxConcurrency = 8, cardPool = None):
         self.quiz=quiz
         self.title=title
         self.numberOfQuestions=numberOfQuestions
         self.appstate=appstate
+        self.isBatched=isBatched
+        self.maxRetries=maxRetries
+        self.isReusing=isReusing
+        self.poolFloor=poolFloor
+        self.maxConcurrency=maxConcurrency
+        self.cardPool=cardPool if cardPool is not None else QuestionCardPool(numberOfQuestions)
+
+    def check_retries(self, retries):
+        if retries > self.maxRetries:
+            raise KeySpaceExhaustedError(f"Could not generate a new question for '{self.title}' after {self.maxRetries} retries.")
+
+    def generate(self):
+        '''
+        Generates a question whose fingerprint is not known to be in the bank, so that the known duplicates are never sent.
+        A false positive of `knownQuestions` only costs another question to be generated.
+        '''
+        repeats = 0
+        while(True):
+            quiz_obj = self.quiz()
+            quiz_obj.fingerprint = quiz_fingerprint(self.title, quiz_obj)
+            if quiz_obj.fingerprint not in knownQuestions:
+                return quiz_obj
+            repeats += 1
+            self.check_retries(repeats)
+
+    def generate_many(self, count):
+        '''
+        Like `generate`, but a `QuestionGenerator` makes the whole batch at once, and fewer than `count` only when its key space runs out.
+        The known questions are not left out here, so that the caller can count them as repeats.
+        '''
+        if isinstance(self.quiz, QuestionGenerator):
+            quiz_objs = self.quiz.make_batch(count)
+        else:
+            quiz_objs = [self.quiz() for x in range(count)]
+        for quiz_obj in quiz_objs:
+            quiz_obj.fingerprint = quiz_fingerprint(self.title, quiz_obj)
+        return quiz_objs
 
-    async def build_ui(self):
-        question_list = []
-        for x in range(self.numberOfQuestions):
-            quiz_obj = None
-            questionid = ""
+    async def insert_slot(self, semaphore):
+        '''
+        Generates and inserts the question of one slot, and retries only this slot on a collision.
+        '''
+        async with semaphore:
+            retries = 0
             while(True):
+                quiz_obj = self.generate()
                 try:
-                    quiz_obj = self.quiz()
-                    question_model = QuestionModel(
-                        question = quiz_obj.question,
-                        solution = quiz_obj.solution,
-                        answer = quiz_obj.answer,
-                        title = self.title
-                        )
-                    await question_model.insert()
-                    questionid = str(question_model.id)
-                    break
+                    questionid = await storage.questions.insert(self.title, quiz_obj)
+                    return quiz_obj, questionid
                 except DuplicateKeyError:
-                    pass
+                    retries += 1
+                    self.check_retries(retries)
+                finally:
+                    knownQuestions.add(quiz_obj.fingerprint) # Either inserted now or already in the bank
 
-            ask = widgets.HTML(f"<strong>{quiz_obj.question}</strong>")
+    async def insert_concurrently(self):
+        '''
+        Yields the slots in the order their inserts finish. A failed slot does not stop the others,
+        and its error is raised once all of them are done.
+        '''
+        semaphore = asyncio.Semaphore(self.maxConcurrency)
+        slots = [asyncio.ensure_future(self.insert_slot(semaphore)) for x in range(self.numberOfQuestions)]
+        error = None
+        try:
+            for slot in asyncio.as_completed(slots):
+                try:
+                    prepared = await slot
+                except (DuplicateKeyError, KeySpaceExhaustedError) as e:
+                    error = error or e
+                    continue
+                yield prepared
+        finally:
+            for slot in slots:
+                slot.cancel()
+        if error is not None:
+            raise error
+
+    async def insert_batched(self):
+        '''
+        Only the questions known to be in the bank or already generated in this batch count as repeats.
+        When the key space runs out or there are too many repeats, the candidates generated so far are still inserted and yielded
+        before `KeySpaceExhaustedError` is raised, so that no drawn index is lost.
+        '''
+        prepared = 0
+        seen = set() # hash set of the fingerprints generated in this batch
+        retries = 0
+        exhausted = None
+        while prepared < self.numberOfQuestions and exhausted is None:
+            candidates = []
+            repeats = 0
+            try:
+                while len(candidates) < self.numberOfQuestions - prepared:
+                    for quiz_obj in self.generate_many(self.numberOfQuestions - prepared - len(candidates)):
+                        if quiz_obj.fingerprint in knownQuestions or quiz_obj.fingerprint in seen:
+                            repeats += 1
+                            continue
+                        seen.add(quiz_obj.fingerprint)
+                        candidates.append(quiz_obj)
+                    if len(candidates) < self.numberOfQuestions - prepared:
+                        self.check_retries(repeats)
+            except KeySpaceExhaustedError as e:
+                exhausted = e
+            if not candidates:
+                break
+
+            questionids = await storage.questions.insert_many(self.title, candidates)
+            for quiz_obj in candidates:
+                knownQuestions.add(quiz_obj.fingerprint) # Either inserted now or already in the bank
+            for quiz_obj, questionid in zip(candidates, questionids):
+                if questionid is not None:
+                    prepared += 1
+                    yield quiz_obj, questionid
+
+            if None in questionids:
+                retries += 1
+                self.check_retries(retries)
+
+        if exhausted is not None:
+            raise exhausted
+
+    async def is_pool_ready(self):
+        '''
+        The pool of a title never shrinks, so it is not counted again once it has reached the floor.
+        '''
+        if QuizHelper.poolSizes.get(self.title, 0) < self.poolFloor:
+            QuizHelper.poolSizes[self.title] = await storage.questions.count(self.title)
+        return QuizHelper.poolSizes[self.title] >= self.poolFloor
 
-            answer = widgets.Text(
-                placeholder="Enter your answer",
-                description=f"Question {x+1}:",
-                disabled=False
-            )
+    async def sample_from_bank(self):
+        for quiz_obj, questionid in await storage.questions.sample(self.title, self.numberOfQuestions):
+            knownQuestions.add(quiz_fingerprint(self.title, quiz_obj))
+            yield quiz_obj, questionid
 
-            correct = widgets.HTML("<strong style='color:green'>Correct!</strong>", layout=widgets.Layout(
-                display="none"
-            ))
+    async def build_ui(self):
+        '''
+        Yields the widget of each question as soon as the question is ready, so that the view can show it straight away.
+        The widget is built here rather than in the slots, so that it is built while the inserts of the other slots are in flight.
+        '''
+        isSampling = self.isReusing and await self.is_pool_ready()
+        if isSampling:
+            prepared = self.sample_from_bank()
+        else:
+            if isinstance(self.quiz, QuestionGenerator):
+                await self.quiz.prepare()
 
-            incorrect = widgets.HTML("<strong style='color:red'>Incorrect! Try again or show the solution</strong>", layout=widgets.Layout(
-                display="none"
-            ))
+            if self.isBatched:
+                prepared = self.insert_batched()
+            else:
+                prepared = self.insert_concurrently()
 
+        x = 0
+        async for quiz_obj, questionid in prepared:
+            if not isSampling:
+                QuizHelper.poolSizes[self.title] = QuizHelper.poolSizes.get(self.title, 0) + 1
+            yield self.cardPool.acquire(x, quiz_obj, questionid, appstate=self.appstate, title=self.title).container
+            x += 1
 
-            solution = widgets.HTML(f"<strong>{quiz_obj.solution}</strong>", layout=widgets.Layout(
-                display="none"
-            ))
+class QuestionCard:
+    '''
+    The widgets of one question. They are built once, and `bind` puts another question into them by changing their values only,
+    so that a card can be used again by the next quiz instead of building new widgets.
+    The container carries the card and its question, so that the card can be found from the widgets of the view.
+    '''
+    def __init__(self):
+        self.ask = widgets.HTML()
 
-            show_solution_btn = widgets.Button(
-                description="Show Solution",
-                disabled=False,
-                button_style="warning",
-                layout=widgets.Layout(
-                    display="none"
-                )
-            )
-            def show_solution(_, w_solution = solution):
-                w_solution.layout.display=""
-            show_solution_btn.on_click(show_solution)
-
-            submit_btn = widgets.Button(
-                description="Submit",
-                disabled=False,
-                button_style="info"
+        self.answer = widgets.Text(
+            placeholder="Enter your answer",
+            disabled=False
+        )
+
+        self.correct = widgets.HTML("<strong style='color:green'>Correct!</strong>", layout=widgets.Layout(
+            display="none"
+        ))
+
+        self.incorrect = widgets.HTML("<strong style='color:red'>Incorrect! Try again or show the solution</strong>", layout=widgets.Layout(
+            display="none"
+        ))
+
+        self.solution = widgets.HTML(layout=widgets.Layout(
+            display="none"
+        ))
+
+        self.show_solution_btn = widgets.Button(
+            description="Show Solution",
+            disabled=False,
+            button_style="warning",
+            layout=widgets.Layout(
+                display="none"
             )
-            # Creation of variable after instantiation
-            submit_btn.isSubmitted = False
-            submit_btn.attempt_model = AttemptModel(
+        )
+        self.show_solution_btn.on_click(self.show_solution)
+
+        self.submit_btn = widgets.Button(
+            description="Submit",
+            disabled=False,
+            button_style="info"
+        )
+        self.submit_btn.on_click(lambda event: traced(f"{self.title} submit", self.submit, event=event))
+
+        self.btn_container = widgets.HBox([self.submit_btn, self.show_solution_btn])
+        self.container = widgets.VBox([self.ask, self.answer, self.solution, self.btn_container, self.correct, self.incorrect], layout=widgets.Layout(
+            border="3px solid",
+            padding="1em",
+            margin="1em 0"
+        ))
+        self.container.card = self
+        self.container.answer_input = self.answer
+        self.container.submit_btn = self.submit_btn
+
+        self.appstate = None
+        self.title = None
+        self.quiz_obj = None
+        self.questionId = None
+        self.isCorrect = False
+
+    def bind(self, x, quiz_obj, questionid, *, appstate, title):
+        self.appstate = appstate
+        self.title = title
+        self.quiz_obj = quiz_obj
+        self.questionId = questionid
+        self.isCorrect = False
+        self.container.quiz_obj = quiz_obj
+
+        with coalesced_sync(self.container): # A trait that keeps its value, e.g. a hidden message, sends nothing
+            self.ask.value = f"<strong>{quiz_obj.question}</strong>"
+            self.answer.description = f"Question {x+1}:"
+            self.answer.value = ""
+            self.solution.value = f"<strong>{quiz_obj.solution}</strong>"
+            for widget in [self.solution, self.show_solution_btn, self.correct, self.incorrect]:
+                widget.layout.display = "none"
+        return self
+
+    def show_solution(self, _):
+        self.solution.layout.display=""
+
+    def submit(self, *, event):
+        isCorrect = is_correct_answer(self.answer.value, self.quiz_obj)
+        with coalesced_sync(self.container): # Only the messages that the second submission changes are sent
+            self.correct.layout.display="none"
+            self.incorrect.layout.display="none"
+            self.show_solution_btn.layout.display="none"
+            if isCorrect:
+                self.correct.layout.display=""
+            else:
+                self.incorrect.layout.display=""
+                self.show_solution_btn.layout.display=""
+
+        # Every submission counts just before it is answered correctly, so nothing is recorded after that.
+        if not self.isCorrect:
+            attemptRecorder.record(
                 userId = self.appstate.userId,
-                questionId = questionid,
-                isCorrect = False
-            )
-            async def submit(
-                *,
-                event,
-                w_quiz_obj,
-                w_answer,
-                w_correct,
-                w_incorrect,
-                w_show_solution_btn
-            ):
-                event.disabled = True
-                isCorrect = w_answer.value.strip() == w_quiz_obj.answer
-                w_correct.layout.display="none"
-                w_incorrect.layout.display="none"
-                w_show_solution_btn.layout.display="none"
-                if isCorrect:
-                    w_correct.layout.display=""
-                else:
-                    w_incorrect.layout.display=""
-                    w_show_solution_btn.layout.display=""
-
-                if not event.isSubmitted:
-                    event.attempt_model.isCorrect = isCorrect
-                    await event.attempt_model.insert()
-                else:
-                    prev = event.attempt_model.isCorrect
-                    event.attempt_model.isCorrect = isCorrect or event.attempt_model.isCorrect
-                    event.attempt_model.timesOfAnswering += 1 if not prev else 0
-                    await event.attempt_model.save()
-                event.isSubmitted = True
-                event.disabled = False
-
-            submit_btn.on_click(
-                lambda event,
-                w_quiz_obj=quiz_obj,
-                w_answer=answer,
-                w_incorrect=incorrect,
-                w_correct=correct,
-                w_show_solution_btn=show_solution_btn:
-            loop.run_until_complete(
-                submit(
-                    event=event,
-                    w_quiz_obj=w_quiz_obj,
-                    w_answer=w_answer,
-                    w_correct=w_correct,
-                    w_incorrect=w_incorrect,
-                    w_show_solution_btn=w_show_solution_btn,
-                    )
-                )
+                questionId = self.questionId,
+                isCorrect = isCorrect,
+                title = self.title
             )
+        self.isCorrect = self.isCorrect or isCorrect
 
-            btn_container = widgets.HBox([submit_btn, show_solution_btn])
-            quiz_container = widgets.VBox([ask, answer, solution, btn_container, correct, incorrect], layout=widgets.Layout(
-                border="3px solid",
-                padding="1em",
-                margin="1em 0"
-            ))
-            question_list.append(quiz_container)
+    def close(self):
+        close_all(self.container)
+
+class QuestionCardPool:
+    '''
+    Keeps the released cards for the next quiz. At most `maxSize` cards are kept, and the surplus ones are closed,
+    so that the number of widgets stays flat however many quizzes are opened.
+    '''
+    def __init__(self, maxSize = 5):
+        self.maxSize = maxSize
+        self.free = []
+        self.created = 0
+
+    def acquire(self, x, quiz_obj, questionid, *, appstate, title):
+        if self.free:
+            card = self.free.pop()
+        else:
+            card = QuestionCard()
+            self.created += 1
+        return card.bind(x, quiz_obj, questionid, appstate=appstate, title=title)
+
+    def release(self, card):
+        if len(self.free) < self.maxSize:
+            self.free.append(card)
+        else:
+            card.close()
+
+    def shrink(self, maxSize):
+        self.maxSize = maxSize
+        while len(self.free) > maxSize:
+            self.free.pop().close()
 
-        return question_list # To make my life easier, I omitted yield keyword
+    def close(self):
+        self.shrink(0)
 
-def make_title(text, _layout=None):
-    return widgets.HTML(f"<h1 style='color: teal'>{text}</h1>",layout=_layout if _layout is not None else widgets.Layout(
+def make_title(text, _layout=None, **kwargs):
+    return WidgetSpec(widgets.HTML, f"<h1 style='color: teal'>{text}</h1>", layout=_layout if _layout is not None else dict(
         text_align="center"
-    ))
+    ), **kwargs)
 
 class MainMenuView(ViewBase):
     title = make_title("Main Menu")
 
-    btn_login = widgets.Button(
+    btn_login = WidgetSpec(widgets.Button,
             description="Login",
             disabled=False,
             button_style="primary"
     )
 
-    btn_register = widgets.Button(
+    btn_register = WidgetSpec(widgets.Button,
             description="Register",
             disabled=False,
             button_style="primary"
     )
 
-    btn_exit = widgets.Button(
+    btn_exit = WidgetSpec(widgets.Button,
             description="Exit",
             disabled=False,
             button_style="danger"
@@ -395,77 +2497,91 @@ class MainMenuController(ControllerBase):
     def on_btn_register(self, event):
         self.router.go(RegisterController)
 
-    def on_btn_exit(self, event):
-        pass
+    async def on_btn_exit(self, event):
+        await attemptRecorder.close()
+        await storage.close()
+        passwordHasher.shutdown()
+        if not self.router.isHeadless:
+            clear_output()
+            print("Disconnected from the database. Run the program again to start over.")
 
 class RegisterView(ViewBase):
     title = make_title("Register Page")
 
-    name = widgets.Text(
+    name = WidgetSpec(widgets.Text,
             placeholder='Enter your name',
             description='Name: ',
             disabled=False,
             style={'description_width': '140px'}
     )
 
-    username = widgets.Text(
+    username = WidgetSpec(widgets.Text,
         placeholder='Enter your username',
         description='Username: ',
         disabled=False,
         style={'description_width': '140px'}
     )
 
-    password = widgets.Password(
+    password = WidgetSpec(widgets.Password,
         description='Password:',
         disabled=False,
         style={'description_width': '140px'}
     )
 
-    confirmed_password = widgets.Password(
+    confirmed_password = WidgetSpec(widgets.Password,
         description='Confirmed Password:',
         disabled=False,
         style={'description_width': '140px'}
     )
 
-    error_text_password_not_match = widgets.HTML(
+    error_text_password_not_match = WidgetSpec(widgets.HTML,
         value="<strong style='color:red'>Password does not match!</strong>",
-        layout=widgets.Layout(display="none")
+        layout=dict(display="none")
     )
 
-    error_text_password_length = widgets.HTML(
+    error_text_password_length = WidgetSpec(widgets.HTML,
         value="<strong style='color:red'>Password is too short!</strong>",
-        layout=widgets.Layout(display="none")
+        layout=dict(display="none")
     )
 
-    error_text_username = widgets.HTML(
+    error_text_username = WidgetSpec(widgets.HTML,
         value="<strong style='color:red'>This username is chosen!</strong>",
-        layout=widgets.Layout(display="none")
+        layout=dict(display="none")
     )
 
-    btn_exit = widgets.Button(
+    btn_exit = WidgetSpec(widgets.Button,
         description="Exit",
         disabled=False,
-        button_style="danger"
+        button_style="danger",
+        isIgnored=True
     )
-    btn_exit.isIgnored = True
 
-    btn_register = widgets.Button(
+    btn_register = WidgetSpec(widgets.Button,
         description="Register",
         disabled=False,
-        button_style="primary"
+        button_style="primary",
+        isIgnored=True
     )
-    btn_register.isIgnored = True
 
-    box = widgets.HBox([btn_exit, btn_register], layout=widgets.Layout(
+    box = WidgetSpec(widgets.HBox, [btn_exit, btn_register], layout=dict(
         justify_content="space-between",
         grid_gap="1.5em"
     ))
 
-    succeeded = widgets.HTML(
+    succeeded = WidgetSpec(widgets.HTML,
         value="<strong style='color:green'>Successfully registered an account! Click 'exit' to return back.</strong>",
-        layout=widgets.Layout(display="none")
+        layout=dict(display="none")
     )
 
+    def clear(self):
+        '''
+        The view is cached, so that the fields and the messages of the last visit are emptied before it is shown again.
+        '''
+        for widget in [self.name, self.username, self.password, self.confirmed_password]:
+            widget.value = ""
+        for widget in [self.error_text_password_not_match, self.error_text_password_length, self.error_text_username, self.succeeded]:
+            widget.layout.display = "none"
+
 class RegisterController(ControllerBase):
     def __init__(self, appstate, router):
         self._obj_view = RegisterView
@@ -474,6 +2590,9 @@ class RegisterController(ControllerBase):
     def on_btn_exit(self, event):
         self.router.go(MainMenuController)
 
+    async def refresh(self):
+        self.view.clear()
+
     async def on_btn_register(self, event):
         try:
             self.view.error_text_password_not_match.layout.display = "none"
@@ -481,6 +2600,8 @@ class RegisterController(ControllerBase):
             self.view.error_text_username.layout.display = "none"
             self.view.succeeded.layout.display = "none"
 
+            name = self.view.name.value
+            username = self.view.username.value
             pwd = self.view.password.value
             conf = self.view.confirmed_password.value
 
@@ -493,16 +2614,13 @@ class RegisterController(ControllerBase):
                 self.view.error_text_password_length.layout.display = ""
                 return
 
-            salt = bcrypt.gensalt()
-            hashed = bcrypt.hashpw(pwd.encode("utf-8"), salt)
+            hashed = await passwordHasher.hash(pwd)
 
-            data = UserModel(
-                name=self.view.name.value,
-                username=self.view.username.value,
+            await storage.users.insert(
+                name=name,
+                username=username,
                 hashedPassword=hashed
             )
-            self.data = data
-            await data.insert()
             self.view.succeeded.layout.display = ""
 
         except DuplicateKeyError:
@@ -511,41 +2629,55 @@ class RegisterController(ControllerBase):
 class LoginView(ViewBase):
     title = make_title("Login Page")
 
-    username = widgets.Text(
+    username = WidgetSpec(widgets.Text,
         placeholder='Enter your username',
         description='Username: ',
         disabled=False,
     )
 
-    password = widgets.Password(
+    password = WidgetSpec(widgets.Password,
         description='Password:',
         disabled=False,
     )
 
-    error_text = widgets.HTML(
+    error_text = WidgetSpec(widgets.HTML,
         value="<strong style='color:red'>Invalid username or/and password</strong>",
-        layout=widgets.Layout(display="none")
+        layout=dict(display="none")
+    )
+
+    btn_resume = WidgetSpec(widgets.Button,
+        disabled=False,
+        button_style="success",
+        layout=dict(display="none")
     )
 
-    btn_exit = widgets.Button(
+    btn_exit = WidgetSpec(widgets.Button,
         description="Exit",
         disabled=False,
-        button_style="danger"
+        button_style="danger",
+        isIgnored=True
     )
-    btn_exit.isIgnored = True
 
-    btn_login = widgets.Button(
+    btn_login = WidgetSpec(widgets.Button,
         description="Login",
         disabled=False,
-        button_style="primary"
+        button_style="primary",
+        isIgnored=True
     )
-    btn_login.isIgnored = True
 
-    box = widgets.HBox([btn_exit, btn_login], layout=widgets.Layout(
+    box = WidgetSpec(widgets.HBox, [btn_exit, btn_login], layout=dict(
         justify_content="space-between",
         grid_gap="1.5em"
     ))
 
+    def clear(self):
+        '''
+        The view is cached, so that the credentials of the last login are emptied before it is shown again.
+        '''
+        self.username.value = ""
+        self.password.value = ""
+        self.error_text.layout.display = "none"
+
 class LoginController(ControllerBase):
     def __init__(self, appstate, router):
         self._obj_view = LoginView
@@ -560,82 +2692,94 @@ class LoginController(ControllerBase):
         username = self.view.username.value
         pwd = self.view.password.value
 
-        result = await UserModel.find_one(UserModel.username == username)
-        hash = ""
-        fakeHash = bcrypt.hashpw(b"invalid", bcrypt.gensalt()) # the register function restricted the lenght of password to be at least eight-character long. Suggested by https://cheatsheetseries.owasp.org/cheatsheets/Authentication_Cheat_Sheet.html#authentication-responses
-
-        if result is not None:
-            hash = result.hashedPassword.encode("utf-8")
-        else:
-            hash = fakeHash
-
-        isAuth = bcrypt.checkpw(pwd.encode("utf-8"), hash) and result is not None
+        result = await storage.users.find_by_username(username)
+        isAuth = await passwordHasher.check(pwd, result.hashedPassword if result is not None else None)
         if isAuth:
+            sessionManager.revoke(self.appstate.sessionToken)
+            self.appstate.sessionToken = sessionManager.issue(result)
             self.appstate.name = result.name
-            self.appstate.userId = str(result.id)
+            self.appstate.userId = result.id
+            self.view.clear() # The password is not kept in the cached view
             self.router.go(DashboardController)
         else:
             self.view.error_text.layout.display = ""
 
+    async def refresh(self):
+        self.view.clear()
+        profile = sessionManager.resume(self.appstate.sessionToken)
+        if profile is None:
+            self.view.btn_resume.layout.display = "none"
+        else:
+            self.view.btn_resume.description = f"Continue as {profile['name']}"
+            self.view.btn_resume.layout.display = ""
+
+    def on_btn_resume(self, event):
+        profile = sessionManager.resume(self.appstate.sessionToken)
+        if profile is None:
+            self.view.btn_resume.layout.display = "none"
+            return
+        self.appstate.name = profile["name"]
+        self.appstate.userId = profile["id"]
+        self.router.go(DashboardController)
+
 class DashboardView(ViewBase):
 
-    title = make_title("Dashboard")
-    title.isIgnored = True
+    title = make_title("Dashboard", isIgnored=True)
 
-    btn_sign_out = widgets.Button(
+    btn_sign_out = WidgetSpec(widgets.Button,
         description="Sign Out",
         disabled=False,
-        button_style="danger"
+        button_style="danger",
+        isIgnored=True
     )
-    btn_sign_out.isIgnored = True
 
-    header = widgets.HBox([title, btn_sign_out], layout=widgets.Layout(
+    header = WidgetSpec(widgets.HBox, [title, btn_sign_out], layout=dict(
         justify_content="space-between",
         align_items="center",
         width="auto",
-    ))
-    header.isIgnored = True
+    ), isIgnored=True)
+
+    welcome_msg = WidgetSpec(widgets.HTML, isIgnored=True)
 
-    welcome_msg = widgets.HTML()
-    welcome_msg.isIgnored = True
+    progress = WidgetSpec(widgets.HTML, isIgnored=True)
 
-    options = widgets.Select(
+    container_welcome = WidgetSpec(widgets.VBox, [welcome_msg, progress], isIgnored=True)
+
+    options = WidgetSpec(widgets.Select,
         options=["Quadratic Equation"],
         description="Topics: ",
         disabled=False,
         style={
             'description_width': 'initial'
-        }
+        },
+        isIgnored=True
     )
-    options.isIgnored = True
 
-    btn_proceed = widgets.Button(
+    btn_proceed = WidgetSpec(widgets.Button,
         description="Proceed",
         disabled=False,
-        button_style="info"
+        button_style="info",
+        isIgnored=True
     )
-    btn_proceed.isIgnored = True
 
-    container_options = widgets.VBox([options, btn_proceed], layout=widgets.Layout(
+    container_options = WidgetSpec(widgets.VBox, [options, btn_proceed], layout=dict(
         align_items="center",
         width="30em"
-    ))
-    container_options.isIgnored = True
+    ), isIgnored=True)
 
-    center = widgets.HBox([welcome_msg, container_options], layout=widgets.Layout(
+    center = WidgetSpec(widgets.HBox, [container_welcome, container_options], layout=dict(
         margin="1px 0",
         width="auto",
         display="grid"
-    ))
-    center.isIgnored = True
+    ), isIgnored=True)
 
-    Layout = widgets.AppLayout(
+    Layout = WidgetSpec(widgets.AppLayout,
         header=header,
         left_sidebar=None,
         center=center,
         right_sidebar=None,
         footer=None,
-        layout=widgets.Layout(
+        layout=dict(
             width="100%",
             padding="1em",
         )
@@ -649,7 +2793,26 @@ class DashboardController(ControllerBase):
         self._obj_view = DashboardView
         super().__init__(appstate, router)
 
-    def on_btn_sign_out(self, event):
+    async def refresh(self):
+        '''
+        The submissions still in the buffer of the recorder are not counted yet.
+        '''
+        self.view.progress.value = self.format_progress(await storage.progress.get(self.appstate.userId))
+
+    @staticmethod
+    def format_progress(progress):
+        if not progress:
+            return "<em>No questions attempted yet.</em>"
+        rows = "".join(
+            f"<tr><td>{title}</td><td>{counters.attempted}</td><td>{counters.correct}</td><td>{counters.averageTimesOfAnswering:.1f}</td></tr>"
+            for title, counters in sorted(progress.items())
+        )
+        return f"<table><tr><th>Topic</th><th>Attempted</th><th>Correct</th><th>Average tries</th></tr>{rows}</table>"
+
+    async def on_btn_sign_out(self, event):
+        await attemptRecorder.flush()
+        self.appstate.userId = ""
+        self.appstate.name = ""
         self.router.go(MainMenuController)
 
     def on_btn_proceed(self, event):
@@ -657,61 +2820,712 @@ class DashboardController(ControllerBase):
             case "Quadratic Equation":
                 self.router.go(QuadraticEquationsController)
 
+def format_fraction(numerator, denominator):
+    return str(numerator) if denominator == 1 else f"{numerator}/{denominator}"
+
+def format_factor(numerator, denominator):
+    '''
+    The factor `(denominator x - numerator)` whose root is numerator/denominator.
+    '''
+    x = "x" if denominator == 1 else f"{denominator}x"
+    if numerator == 0:
+        return x
+    return f"({x} - {numerator})" if numerator > 0 else f"({x} + {-numerator})"
+
+def format_polynomial(a, b, c):
+    terms = [("" if a == 1 else str(a)) + "x²"]
+    for coefficient, power in ((b, "x"), (c, "")):
+        if coefficient == 0:
+            continue
+        magnitude = abs(coefficient)
+        terms.append(("- " if coefficient < 0 else "+ ") + ("" if magnitude == 1 and power else str(magnitude)) + power)
+    return " ".join(terms)
+
+class QuadraticEngine:
+    '''
+    Makes quadratic equations `k(q1 x - p1)(q2 x - p2) = 0` with rational roots p1/q1 <= p2/q2, in batches with NumPy.
+    Every equation has an index in a mixed-radix key space: the leading factor k is the high digit,
+    and the pair of roots (i1 <= i2) in the sorted candidate roots is the low digit, numbered along a triangle.
+    The difficulty of every index is computed at once, so that a generator can keep only the indices of one difficulty.
+    '''
+    difficulties = ["easy", "medium", "hard"]
+
+    def __init__(self, *, maxRoot = 9, maxDenominator = 2, maxLeading = 2):
+        np = lazy_import("numpy")
+        self.maxLeading = maxLeading
+        numerators, denominators = np.meshgrid(np.arange(-maxRoot * maxDenominator, maxRoot * maxDenominator + 1), np.arange(1, maxDenominator + 1))
+        numerators, denominators = numerators.ravel(), denominators.ravel()
+        isReduced = (np.gcd(numerators, denominators) == 1) & (np.abs(numerators) <= maxRoot * denominators)
+        numerators, denominators = numerators[isReduced], denominators[isReduced]
+        order = np.argsort(numerators / denominators)
+        self.numerators, self.denominators = numerators[order], denominators[order]
+        self.rootCount = len(self.numerators)
+        self.pairCount = self.rootCount * (self.rootCount + 1) // 2
+        self.size = self.maxLeading * self.pairCount
+
+    def decode(self, indices):
+        '''
+        Returns the leading factors and the positions of both roots of every index.
+        '''
+        np = lazy_import("numpy")
+        indices = np.asarray(indices, dtype=np.int64)
+        leading, pairs = np.divmod(indices, self.pairCount)
+        m = self.rootCount
+        # The row i1 of the triangle starts at i1 * m - i1 * (i1 - 1) / 2, which is inverted with a square root and then corrected for rounding
+        first = np.floor(((2 * m + 1) - np.sqrt((2 * m + 1) ** 2 - 8 * pairs)) / 2).astype(np.int64)
+        start = lambda row: row * m - row * (row - 1) // 2
+        first -= start(first) > pairs
+        first += start(first + 1) <= pairs
+        second = pairs - start(first) + first
+        return leading + 1, first, second
+
+    def columns(self, indices):
+        np = lazy_import("numpy")
+        k, first, second = self.decode(indices)
+        p1, q1 = self.numerators[first], self.denominators[first]
+        p2, q2 = self.numerators[second], self.denominators[second]
+        return {
+            "k": k, "p1": p1, "q1": q1, "p2": p2, "q2": q2,
+            "a": k * q1 * q2,
+            "b": -k * (p1 * q2 + p2 * q1),
+            "c": k * p1 * p2,
+            "isDouble": first == second,
+        }
+
+    def difficulty_of(self, columns):
+        '''
+        easy: integer roots and no leading factor; hard: both roots are fractions, or a fraction with a leading factor; medium: the rest.
+        '''
+        np = lazy_import("numpy")
+        fractions = (columns["q1"] > 1).astype(np.int64) + (columns["q2"] > 1)
+        isEasy = (fractions == 0) & (columns["k"] == 1)
+        isHard = (fractions == 2) | ((fractions == 1) & (columns["k"] > 1))
+        return np.select([isEasy, isHard], [0, 2], default=1)
+
+    def indices_of(self, difficulty):
+        np = lazy_import("numpy")
+        every = np.arange(self.size, dtype=np.int64)
+        return every[self.difficulty_of(self.columns(every)) == self.difficulties.index(difficulty)]
+
+    def parameters(self, index):
+        columns = self.columns([index])
+        return tuple(int(columns[name][0]) for name in ("k", "p1", "q1", "p2", "q2"))
+
+    def render(self, indices):
+        '''
+        Renders the question, solution and answer of every index in one pass over the columns.
+        '''
+        columns = {name: column.tolist() for name, column in self.columns(indices).items()}
+        return self.render_rows(zip(*(columns[name] for name in ("k", "p1", "q1", "p2", "q2", "a", "b", "c", "isDouble"))))
+
+    @staticmethod
+    def render_rows(rows):
+        rendered = []
+        for k, p1, q1, p2, q2, a, b, c, isDouble in rows:
+            roots = [format_fraction(p1, q1)] if isDouble else [format_fraction(p1, q1), format_fraction(p2, q2)]
+            factors = f"{format_factor(p1, q1)}²" if isDouble else format_factor(p1, q1) + format_factor(p2, q2)
+            rendered.append((
+                (k, p1, q1, p2, q2),
+                f"Solve {format_polynomial(a, b, c)} = 0",
+                f"Factorise: {'' if k == 1 else k}{factors} = 0, so x = {' or x = '.join(roots)}",
+                ", ".join(roots)
+            ))
+        return rendered
+
+    def benchmark(self, count = 100_000):
+        '''
+        Returns how many questions per second are rendered from random indices.
+        '''
+        np = lazy_import("numpy")
+        indices = np.random.default_rng().integers(0, self.size, count)
+        start = time.perf_counter()
+        self.render(indices)
+        return count / (time.perf_counter() - start)
+
+class QuadraticEquationsGenerator(QuestionGenerator):
+    '''
+    Draws from the indices of `QuadraticEngine` of one difficulty, or of all of them when `difficulty` is None.
+    The engine index is saved as `keyIndex` whatever the difficulty, so that every generator of the title knows the questions of the others.
+    The engine is built on first use, so that NumPy is not imported before a quiz is opened.
+    '''
+    def __init__(self, title, difficulty = None):
+        super().__init__(title)
+        self.difficulty = difficulty
+        self._engine = None
+        self._indices = None
+        self._positions = None # key: engine index, value: its index in the key space of the difficulty
+
+    @property
+    def engine(self):
+        if self._engine is None:
+            self._engine = QuadraticEngine()
+            if self.difficulty is not None:
+                self._indices = self._engine.indices_of(self.difficulty)
+                self._positions = {int(index): position for position, index in enumerate(self._indices)}
+        return self._engine
+
+    @property
+    def keySpaceName(self):
+        return self.difficulty
+
+    def key_index(self, index):
+        return int(self.engine_indices(index))
+
+    def local_index(self, keyIndex):
+        engine = self.engine
+        if self._positions is None:
+            return keyIndex if 0 <= keyIndex < engine.size else None
+        return self._positions.get(keyIndex)
+
+    @property
+    def keySpaceSize(self):
+        engine = self.engine
+        return engine.size if self._indices is None else len(self._indices)
+
+    def engine_indices(self, indices):
+        return indices if self._indices is None else self._indices[indices]
+
+    def parameters(self, index):
+        return self.engine.parameters(int(self.engine_indices(index)))
+
+    def make(self, parameters):
+        k, p1, q1, p2, q2 = parameters
+        row = (k, p1, q1, p2, q2, k * q1 * q2, -k * (p1 * q2 + p2 * q1), k * p1 * p2, (p1, q1) == (p2, q2))
+        (_, question, solution, answer), = QuadraticEngine.render_rows([row])
+        return Quiz(question = question, solution = solution, answer = answer, canonicalAnswer = canonical_roots([Fraction(p1, q1), Fraction(p2, q2)]))
+
+    def make_many(self, indices):
+        np = lazy_import("numpy")
+        quiz_objs = []
+        engineIndices = self.engine_indices(np.asarray(indices, dtype=np.int64))
+        for engineIndex, (parameters, question, solution, answer) in zip(engineIndices.tolist(), self.engine.render(engineIndices)):
+            k, p1, q1, p2, q2 = parameters
+            quiz_objs.append(Quiz(
+                question = question,
+                solution = solution,
+                answer = answer,
+                keyIndex = engineIndex,
+                fingerprint = question_fingerprint(self.title, parameters),
+                canonicalAnswer = canonical_roots([Fraction(p1, q1), Fraction(p2, q2)]) # Straight from the roots, without parsing the answer
+            ))
+        return quiz_objs
+
 class QuadraticEquationsView(ViewBase):
     title = make_title("Quadratic Equation Quiz")
 
-    instruction = widgets.HTML("<strong>Solve for x for each question</strong>")
+    instruction = WidgetSpec(widgets.HTML, "<strong>Solve for x for each question</strong>")
 
-    exit_btn = widgets.Button(
+    exit_btn = WidgetSpec(widgets.Button,
         description="Exit",
         disabled=False,
         button_style="danger"
     )
 
-    def link(self):
-        new_widgets = loop.run_until_complete(
-            QuizHelper(
-                appstate=self.appstate,
-                quiz=self.quiz_generator,
-                title="Quadratic Equation"
-            ).build_ui()
-        )
-        self.widgets.extend(new_widgets)
+    quiz_generator = QuadraticEquationsGenerator("Quadratic Equation")
 
-    def quiz_generator(self):
-        return Quiz(
-            question = "Sample Quadratic Equation Question"+ str(random.randint(0, 1000)),
-            solution = "Sample Quadratic Equation Solution",
-            answer = "answer"
-        )
+    isRestreamed = True # Every visit is a new quiz, whose questions are put into the cards of the previous one
+
+    def __init__(self, appstate):
+        super().__init__(appstate)
+        self.cardPool = QuestionCardPool()
+
+    async def stream(self):
+        try:
+            async for widget in QuizHelper(
+                    appstate=self.appstate,
+                    quiz=self.quiz_generator,
+                    title=self.quiz_generator.title,
+                    cardPool=self.cardPool
+                ).build_ui():
+                yield widget
+        except KeySpaceExhaustedError:
+            yield widgets.HTML("<strong style='color:red'>There are no new questions left for this topic.</strong>")
+
+    def discard(self, widget):
+        if hasattr(widget, "card"):
+            self.cardPool.release(widget.card)
+        else:
+            close_all(widget)
+
+    def destroy(self):
+        super().destroy()
+        self.cardPool.close()
 
 class QuadraticEquationsController(ControllerBase):
     def __init__(self, appstate, router):
         self._obj_view = QuadraticEquationsView
         super().__init__(appstate, router)
 
-    def on_exit_btn(self, event):
+    async def on_exit_btn(self, event):
+        await attemptRecorder.flush() # So that the dashboard counts the submissions of this quiz
         self.router.go(DashboardController)
 
-############################## ENTRY POINT ##############################
-print("Trying to connect to the database...")
+CONTROLLERS = [MainMenuController, RegisterController, LoginController, DashboardController, QuadraticEquationsController]
+
+############################## Benchmark ##############################
+
+def percentile(samples, p):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(p / 100 * len(ordered)) - 1))]
 
-# Create a new client and connect to the server
-client = AsyncIOMotorClient(userdata.get("MongoDBAtlasConnectionString")) # The connection string will be revoked after WA3 is graded
+class BenchmarkRecorder:
+    def __init__(self):
+        self.samples = dict() # key: operation name, value: list of (seconds, repository calls, database commands)
+        self.phaseSeconds = dict() # key: operation name, value: how long all the operations took together
+
+    async def measure(self, operation, awaitable):
+        '''
+        Every measurement runs in its own task, so that its span only counts the calls and the commands of its own operation.
+        '''
+        with tracer.span(operation, kind="benchmark") as span:
+            start = time.perf_counter()
+            result = await awaitable
+            self.samples.setdefault(operation, []).append((time.perf_counter() - start, span.counters.get("repositoryCalls", 0), span.counters.get("dbCommands", 0)))
+        return result
+
+    async def phase(self, operation, awaitables):
+        start = time.perf_counter()
+        await asyncio.gather(*(self.measure(operation, awaitable) for awaitable in awaitables))
+        self.phaseSeconds[operation] = self.phaseSeconds.get(operation, 0.0) + time.perf_counter() - start
+
+    def summary(self):
+        result = dict()
+        for operation, samples in self.samples.items():
+            latencies = [seconds for seconds, _, _ in samples]
+            result[operation] = {
+                "count": len(samples),
+                "p50Ms": percentile(latencies, 50) * 1000,
+                "p95Ms": percentile(latencies, 95) * 1000,
+                "p99Ms": percentile(latencies, 99) * 1000,
+                "opsPerSecond": len(samples) / self.phaseSeconds[operation] if self.phaseSeconds[operation] > 0 else float("inf"),
+                "repositoryCallsPerOp": sum(calls for _, calls, _ in samples) / len(samples),
+                "dbCommandsPerOp": sum(commands for _, _, commands in samples) / len(samples),
+            }
+        return result
+
+class VirtualUser:
+    '''
+    A simulated student who drives the controllers of a headless router in the same way as clicking the buttons.
+    Every virtual user has its own router, and so its own views and widgets.
+    '''
+    def __init__(self, username, password):
+        self.username = username
+        self.password = password
+        self.router = Router(isHeadless=True)
+        for controller in CONTROLLERS:
+            self.router.register_one(controller)
+        self.cards = []
+
+    def controller(self, controller):
+        return self.router.controllers[controller.__name__]
+
+    async def register(self):
+        self.router.go(RegisterController)
+        view = self.controller(RegisterController).view
+        view.name.value = self.username
+        view.username.value = self.username
+        view.password.value = self.password
+        view.confirmed_password.value = self.password
+        await self.controller(RegisterController).on_btn_register(None)
+
+    async def login(self):
+        self.router.go(LoginController)
+        view = self.controller(LoginController).view
+        view.username.value = self.username
+        view.password.value = self.password
+        await self.controller(LoginController).on_btn_login(None)
+        if not self.router.appstate.userId:
+            raise RuntimeError(f"The benchmark user {self.username} could not log in.")
+
+    async def open_quiz(self):
+        await self.router.go_async(QuadraticEquationsController)
+        self.cards = [widget for widget in self.controller(QuadraticEquationsController).view.widgets if hasattr(widget, "submit_btn")]
+
+    async def resume(self):
+        '''
+        Signs out and comes back through the session instead of the password.
+        '''
+        await self.controller(DashboardController).on_btn_sign_out(None)
+        await self.router.go_async(LoginController)
+        self.controller(LoginController).on_btn_resume(None)
+        if not self.router.appstate.userId:
+            raise RuntimeError(f"The benchmark user {self.username} could not resume the session.")
+
+    async def open_dashboard(self):
+        await self.router.go_async(DashboardController)
+
+    def submissions(self):
+        '''
+        Every question is answered wrongly once and then correctly.
+        '''
+        for card in self.cards:
+            for answer in ["wrong answer", card.quiz_obj.answer]:
+                async def submit(card=card, answer=answer):
+                    card.answer_input.value = answer
+                    card.submit_btn.click()
+                yield submit()
+
+@contextmanager
+def swap_globals(**values):
+    previous = {name: globals().get(name) for name in values}
+    globals().update(values)
+    try:
+        yield
+    finally:
+        globals().update(previous)
+
+def current_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+async def run_benchmark(*, users = 30, backend = None, rounds = None, resultsPath = "benchmark_results.jsonl"):
+    '''
+    Simulates `users` students registering, logging in, opening a quiz and submitting answers at the same time,
+    and appends the latency percentiles, throughput, repository calls and database commands of each operation to `resultsPath`,
+    so that the results of different commits can be compared with `compare_benchmarks`.
+    It runs on a fresh `MemoryStorage` unless another `backend` is given.
+    The virtual users go through the module globals of the app, which are swapped for the run,
+    so that it refuses to run in a process where the app has already set up its storage.
+    '''
+    if globals().get("storage") is not None:
+        raise RuntimeError("The benchmark cannot run next to the app, as it swaps the storage of the module. Run `python WA3.py benchmark` instead.")
 
-await init_beanie(database=client["WA3"], document_models=[UserModel, QuestionModel, AttemptModel])
-await client.admin.command('ping')
+    backend = CountingStorage(backend if backend is not None else MemoryStorage())
+    hasher = PasswordHasher(rounds=rounds) if rounds is not None else passwordHasher
+    recorder = BenchmarkRecorder()
+    runId = PydanticObjectId()
 
-print("Connected!")
-time.sleep(0.3)
+    with swap_globals(storage=backend, passwordHasher=hasher, knownQuestions=BloomFilter(), attemptRecorder=AttemptRecorder()):
+        poolSizes, registry = QuizHelper.poolSizes, QuestionKeySpace.registry
+        QuizHelper.poolSizes, QuestionKeySpace.registry = dict(), dict() # The caches belong to the storage that is swapped out
+        try:
+            await backend.connect()
+            virtual_users = [VirtualUser(f"benchmark-{runId}-{index}", "benchmark-password") for index in range(users)]
+            await recorder.phase("register", [virtual_user.register() for virtual_user in virtual_users])
+            await recorder.phase("login", [virtual_user.login() for virtual_user in virtual_users])
+            await recorder.phase("open quiz", [virtual_user.open_quiz() for virtual_user in virtual_users])
+            await recorder.phase("submit", [submission for virtual_user in virtual_users for submission in virtual_user.submissions()])
+            await recorder.phase("flush attempts", [attemptRecorder.flush()])
+            await recorder.phase("dashboard", [virtual_user.open_dashboard() for virtual_user in virtual_users])
+            await recorder.phase("resume session", [virtual_user.resume() for virtual_user in virtual_users])
+        finally:
+            QuizHelper.poolSizes, QuestionKeySpace.registry = poolSizes, registry
+            await attemptRecorder.close()
+            await backend.close()
+
+    result = {
+        "timeStamp": datetime.now().isoformat(),
+        "commit": current_commit(),
+        "users": users,
+        "backend": type(backend.backend).__name__,
+        "bcryptRounds": hasher.rounds,
+        "operations": recorder.summary(),
+    }
+    if isinstance(backend.backend, MongoStorage):
+        result["pool"] = backend.backend.poolStatistics.snapshot()
+    if resultsPath is not None:
+        with open(resultsPath, "a") as f:
+            f.write(json.dumps(result) + "\n")
+    return result
+
+def format_benchmark(result):
+    lines = [f"commit {result['commit']}, {result['users']} users on {result['backend']}, bcrypt rounds {result['bcryptRounds']}",
+             f"{'operation':<16}{'count':>7}{'p50 (ms)':>10}{'p95 (ms)':>10}{'p99 (ms)':>10}{'ops/s':>10}{'calls/op':>10}{'cmds/op':>10}"]
+    for operation, stats in result["operations"].items():
+        lines.append(f"{operation:<16}{stats['count']:>7}{stats['p50Ms']:>10.2f}{stats['p95Ms']:>10.2f}{stats['p99Ms']:>10.2f}{stats['opsPerSecond']:>10.1f}{stats['repositoryCallsPerOp']:>10.2f}{stats['dbCommandsPerOp']:>10.2f}")
+    if "pool" in result:
+        pool = result["pool"]
+        lines.append(f"pool: max {pool['maxCheckedOut']} checked out, {pool['checkOuts']} checkouts, wait mean {pool['meanWaitMs']:.2f} ms / max {pool['maxWaitMs']:.2f} ms, {pool['checkOutFailures']} failed")
+    return "\n".join(lines)
+
+def compare_benchmarks(resultsPath = "benchmark_results.jsonl", before = -2, after = -1):
+    '''
+    Compares two saved runs, by default the last two, and returns the change of p95 latency and throughput of each operation.
+    '''
+    with open(resultsPath) as f:
+        results = [json.loads(line) for line in f if line.strip()]
+    old, new = results[before], results[after]
+    lines = [f"{old['commit']} -> {new['commit']}",
+             f"{'operation':<16}{'p95 (ms)':>22}{'ops/s':>22}"]
+    for operation, stats in new["operations"].items():
+        previous = old["operations"].get(operation)
+        if previous is None:
+            continue
+        lines.append(f"{operation:<16}{previous['p95Ms']:>10.2f} -> {stats['p95Ms']:<8.2f}{previous['opsPerSecond']:>10.1f} -> {stats['opsPerSecond']:<8.1f}")
+    return "\n".join(lines)
+
+def benchmark_command(arguments):
+    parser = argparse.ArgumentParser(prog="WA3.py benchmark", description="Simulates concurrent students without a notebook front end.")
+    parser.add_argument("--users", type=int, default=30)
+    parser.add_argument("--storage", choices=["memory", "mongo"], default="memory")
+    parser.add_argument("--rounds", type=int, default=None, help="bcrypt cost factor, the default of the app is used if omitted")
+    parser.add_argument("--output", default="benchmark_results.jsonl")
+    parser.add_argument("--compare", action="store_true", help="compare with the previous run in the output file")
+    args = parser.parse_args(arguments)
+
+    backend = MongoStorage() if args.storage == "mongo" else MemoryStorage()
+    result = loop.run_until_complete(run_benchmark(users=args.users, backend=backend, rounds=args.rounds, resultsPath=args.output))
+    print(format_benchmark(result))
+    if args.compare:
+        print(compare_benchmarks(args.output))
+    loop.run_until_complete(backend.close())
+
+############################## End of Benchmark ##############################
+
+############################## Question Bank Transfer ##############################
+'''
+The question bank is exported to and imported from a stream of BSON documents, each of which starts with its own length.
+Both write a checkpoint next to the file after every batch, and carry on from it when they are run again after an interruption.
+'''
+
+def question_document(questionid, title, quiz_obj):
+    return {
+        "_id": bson.ObjectId(questionid),
+        "title": title,
+        "question": quiz_obj.question,
+        "solution": quiz_obj.solution,
+        "answer": quiz_obj.answer,
+        "keyIndex": quiz_obj.keyIndex,
+        "fingerprint": bson.Int64(quiz_fingerprint(title, quiz_obj)),
+        "canonicalAnswer": quiz_obj.canonicalAnswer,
+    }
+
+def question_record(document):
+    return str(document["_id"]), document["title"], Quiz(
+        question = document["question"],
+        solution = document["solution"],
+        answer = document["answer"],
+        keyIndex = document.get("keyIndex"),
+        fingerprint = document.get("fingerprint"),
+        canonicalAnswer = document.get("canonicalAnswer")
+    )
 
-clear_output()
+def read_checkpoint(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def write_checkpoint(path, checkpoint):
+    with open(path + ".tmp", "w") as f:
+        json.dump(checkpoint, f)
+    os.replace(path + ".tmp", path) # A checkpoint is either the old one or the new one, even if the program is killed while writing it
+
+def read_bson_stream(f):
+    '''
+    Yields every document of the stream with the offset right after it, so that the offset can be saved as a checkpoint.
+    '''
+    while True:
+        header = f.read(4)
+        if not header:
+            return
+        body = f.read(int.from_bytes(header, "little") - 4)
+        if len(header) < 4 or len(body) < int.from_bytes(header, "little") - 4:
+            raise ValueError(f"The stream is cut off at offset {f.tell()}.")
+        yield bson.decode(header + body), f.tell()
+
+async def export_questions(path, *, title = None, batchSize = 1000, isResuming = True):
+    '''
+    Returns the number of exported questions, including the ones exported before an interruption.
+    '''
+    checkpointPath = path + ".checkpoint"
+    checkpoint = read_checkpoint(checkpointPath) if isResuming else None
+    if checkpoint is None:
+        checkpoint = {"after": None, "offset": 0, "count": 0}
+        open(path, "wb").close()
+
+    with open(path, "r+b") as f:
+        f.truncate(checkpoint["offset"]) # Drops whatever was written after the last checkpoint
+        f.seek(checkpoint["offset"])
+
+        def write(batch, after):
+            f.write(b"".join(batch))
+            f.flush()
+            os.fsync(f.fileno())
+            checkpoint.update(after=after, offset=f.tell(), count=checkpoint["count"] + len(batch))
+            write_checkpoint(checkpointPath, checkpoint)
+
+        batch, after = [], checkpoint["after"]
+        async for questionid, questionTitle, quiz_obj in storage.questions.export(title=title, after=checkpoint["after"], batchSize=batchSize):
+            batch.append(bson.encode(question_document(questionid, questionTitle, quiz_obj)))
+            after = questionid
+            if len(batch) >= batchSize:
+                write(batch, after)
+                batch = []
+        if batch:
+            write(batch, after)
+
+    with suppress(FileNotFoundError):
+        os.remove(checkpointPath)
+    return checkpoint["count"]
+
+async def import_questions(path, *, batchSize = 1000, isResuming = True):
+    '''
+    Holds one batch in memory at a time. The questions already in the bank are skipped,
+    so that a batch which was inserted but not checkpointed is harmless when it is imported again.
+    Returns the numbers of read and inserted questions, including the ones before an interruption.
+    '''
+    checkpointPath = path + ".checkpoint"
+    checkpoint = (read_checkpoint(checkpointPath) if isResuming else None) or {"offset": 0, "count": 0, "inserted": 0}
+
+    async def insert(batch, offset):
+        inserted = await storage.questions.insert_exported(batch)
+        checkpoint.update(offset=offset, count=checkpoint["count"] + len(batch), inserted=checkpoint["inserted"] + inserted)
+        write_checkpoint(checkpointPath, checkpoint)
+
+    with open(path, "rb") as f:
+        f.seek(checkpoint["offset"])
+        batch, offset = [], checkpoint["offset"]
+        for document, offset in read_bson_stream(f):
+            batch.append(question_record(document))
+            if len(batch) >= batchSize:
+                await insert(batch, offset)
+                batch = []
+        if batch:
+            await insert(batch, offset)
+
+    with suppress(FileNotFoundError):
+        os.remove(checkpointPath)
+    return checkpoint["count"], checkpoint["inserted"]
+
+############################## End of Question Bank Transfer ##############################
 
-router = Router()
-router.register_one(MainMenuController)
-router.register_one(RegisterController)
-router.register_one(LoginController)
-router.register_one(DashboardController)
-router.register_one(QuadraticEquationsController)
+############################## ENTRY POINT ##############################
 
-router.go(MainMenuController)
+def make_storage():
+    '''
+    `WA3_STORAGE=memory` runs everything offline without a database.
+    '''
+    if os.environ.get("WA3_STORAGE", "mongo") == "memory":
+        return MemoryStorage()
+    return MongoStorage()
+
+def start_app():
+    global storage, router
+
+    storage = CountingStorage(make_storage())
+
+    print("Trying to connect to the database...")
+    connecting = asyncio.ensure_future(storage.connect())
+    loop.run_until_complete(asyncio.sleep(0)) # Let the connection start before the main menu is rendered, the buttons respond once the connection is ready
+
+    clear_output()
+
+    with startupTimer.span("render main menu"):
+        router = Router()
+        for controller in CONTROLLERS:
+            router.register_one(controller)
+
+        router.go(MainMenuController)
+
+    loop.run_until_complete(connecting)
+
+    if os.environ.get("WA3_STARTUP_REPORT"): # e.g. %env WA3_STARTUP_REPORT=1 in the notebook
+        print(startupTimer.report())
+
+def refill_command(arguments):
+    global storage
+
+    parser = argparse.ArgumentParser(prog="WA3.py refill", description="Generates quadratic equations in one batch and inserts them into the question bank.")
+    parser.add_argument("--title", default="Quadratic Equation")
+    parser.add_argument("--difficulty", choices=QuadraticEngine.difficulties, default=None)
+    parser.add_argument("--count", type=int, default=1000)
+    parser.add_argument("--batch-size", type=int, default=1000, help="questions per insert_many")
+    parser.add_argument("--dry-run", action="store_true", help="only measure the generation, without a database")
+    args = parser.parse_args(arguments)
+
+    storage = MemoryStorage() if args.dry_run else MongoStorage(healthCheckInterval=None)
+    loop.run_until_complete(storage.connect())
+    try:
+        generator = QuadraticEquationsGenerator(args.title, args.difficulty)
+        loop.run_until_complete(generator.prepare())
+        start = time.perf_counter()
+        quiz_objs = generator.make_batch(args.count) if generator.key_space else []
+        elapsed = time.perf_counter() - start
+        print(f"Generated {len(quiz_objs)} questions in {elapsed:.3f} s ({len(quiz_objs) / elapsed if elapsed else 0:.0f} questions/s), {len(generator.key_space)} left in the key space.")
+
+        if args.dry_run:
+            return
+        inserted = 0
+        for offset in range(0, len(quiz_objs), args.batch_size):
+            questionids = loop.run_until_complete(storage.questions.insert_many(args.title, quiz_objs[offset:offset + args.batch_size]))
+            inserted += sum(questionid is not None for questionid in questionids)
+        print(f"Inserted {inserted} questions into '{args.title}'.")
+    finally:
+        loop.run_until_complete(storage.close())
+
+def transfer_command(name, arguments):
+    global storage
+
+    parser = argparse.ArgumentParser(prog=f"WA3.py {name}", description=f"Streams the question bank {'to' if name == 'export' else 'from'} a file of BSON documents.")
+    parser.add_argument("path")
+    if name == "export":
+        parser.add_argument("--title", default=None, help="only export the questions of this title")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--restart", action="store_true", help="ignore the checkpoint of an interrupted run")
+    args = parser.parse_args(arguments)
+
+    storage = make_storage()
+    if isinstance(storage, MongoStorage):
+        storage.healthCheckInterval = None
+    loop.run_until_complete(storage.connect())
+    try:
+        start = time.perf_counter()
+        if name == "export":
+            count = loop.run_until_complete(export_questions(args.path, title=args.title, batchSize=args.batch_size, isResuming=not args.restart))
+            print(f"Exported {count} questions to {args.path} in {time.perf_counter() - start:.1f} s.")
+        else:
+            count, inserted = loop.run_until_complete(import_questions(args.path, batchSize=args.batch_size, isResuming=not args.restart))
+            print(f"Read {count} questions from {args.path} and inserted {inserted} of them in {time.perf_counter() - start:.1f} s.")
+    finally:
+        loop.run_until_complete(storage.close())
+
+def rebuild_progress_command(arguments):
+    parser = argparse.ArgumentParser(prog="WA3.py rebuild-progress", description="Recomputes the progress of the users from their attempts on MongoDB.")
+    parser.add_argument("--user", default=None, help="id of the only user to rebuild, every user is rebuilt if omitted")
+    args = parser.parse_args(arguments)
+
+    backend = MongoStorage(healthCheckInterval=None)
+    loop.run_until_complete(backend.connect())
+    try:
+        loop.run_until_complete(backend.progress.rebuild(args.user))
+    finally:
+        loop.run_until_complete(backend.close())
+    print("The progress of", "every user" if args.user is None else f"user {args.user}", "has been rebuilt.")
+
+def explain_command(arguments):
+    parser = argparse.ArgumentParser(prog="WA3.py explain", description="Checks that no query of the repositories scans a whole collection on MongoDB.")
+    parser.parse_args(arguments)
+
+    backend = MongoStorage(healthCheckInterval=None)
+    loop.run_until_complete(backend.connect())
+    try:
+        plans = loop.run_until_complete(backend.explain_queries())
+    except CollectionScanError as e:
+        plans = e.plans
+        print(e, file=sys.stderr)
+    finally:
+        loop.run_until_complete(backend.close())
+
+    for name, stages in plans.items():
+        print(f"{name:<28}{' <- '.join(stages)}")
+    if any("COLLSCAN" in stages for stages in plans.values()):
+        sys.exit(1)
+
+COMMANDS = {
+    "benchmark": benchmark_command,
+    "refill": refill_command,
+    "export": lambda arguments: transfer_command("export", arguments),
+    "import": lambda arguments: transfer_command("import", arguments),
+    "rebuild-progress": rebuild_progress_command,
+    "explain": explain_command,
+}
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] in COMMANDS:
+        COMMANDS[sys.argv[1]](sys.argv[2:])
+    else:
+        start_app()